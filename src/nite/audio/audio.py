@@ -1,30 +1,35 @@
+from dataclasses import dataclass, field
+
 import pyaudio
 import structlog
-from pydantic import BaseModel, computed_field
 
 logger = structlog.get_logger("nite.audio")
 
 
-class AudioFormat(BaseModel):
+@dataclass(frozen=True, slots=True)
+class AudioFormat:
+    """
+    Format of the audio samples read from the microphone. A plain frozen dataclass, it's
+    read on every audio block. The derived values are computed once at creation.
+    """
+
     name: str
     pyaudio_format: int
     bits_per_sample: int
-    unpack_format: str
-
-    @computed_field  # type: ignore[misc]
-    @property
-    def max_value(self) -> int:
-        return 2**self.bits_per_sample
+    # Numpy dtype of the samples, used to read the raw audio blocks without copying them
+    numpy_dtype: str
+    max_value: int = field(init=False)
+    normalization_factor: float = field(init=False)
 
-    @computed_field  # type: ignore[misc]
-    @property
-    def normalization_factor(self) -> float:
-        return 1 / self.max_value
+    def __post_init__(self) -> None:
+        # The dataclass is frozen, the attributes can only be set through object
+        object.__setattr__(self, "max_value", 2**self.bits_per_sample)
+        object.__setattr__(self, "normalization_factor", 1 / self.max_value)
 
 
 short_format = AudioFormat(
     name="short",
     pyaudio_format=pyaudio.paInt16,
     bits_per_sample=16,
-    unpack_format="%dh",
+    numpy_dtype="int16",
 )
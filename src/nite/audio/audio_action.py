@@ -1,4 +1,3 @@
-import asyncio
 from abc import ABC, abstractmethod
 from enum import Enum
 from typing import List, Optional, Tuple
@@ -28,7 +27,7 @@ class BPMActionFrequency(int, Enum):
 
 class AudioAction(ABC):
     @abstractmethod
-    async def act(self, time_in_ms: int) -> Tuple[bool, float]:
+    def act(self, time_in_ms: float) -> Tuple[bool, float]:
         pass
 
 
@@ -46,7 +45,7 @@ class AudioActionBPM(AudioAction):
         self.beats_per_compass = beats_per_compass
         self.bpm_action_frequency = bpm_action_frequency
         logger.info(f"Beats per compass: {beats_per_compass}. Frequency: {bpm_action_frequency}. ")
-        self.time_since_last_timeout_ms: int = 0
+        self.time_since_last_timeout_ms: float = 0
         self.bpm: Optional[float] = None
         self.action_period_timeout_sec: Optional[float] = None
 
@@ -54,8 +53,11 @@ class AudioActionBPM(AudioAction):
         """
         Set a new detected BPM from the audio processing.
 
-        Every time the BPM is set, the action period timeout is recalculated.
+        Every time the BPM changes, the action period timeout is recalculated. The BPM is set on
+        every audio block and most of the time it's the same.
         """
+        if bpm == self.bpm:
+            return
         self.bpm = bpm
         self.action_period_timeout_sec = self._calculate_period_timeout_sec(bpm)
 
@@ -96,7 +98,7 @@ class AudioActionBPM(AudioAction):
             bar_duration_sec, self.bpm_action_frequency, self.beats_per_compass
         )
 
-    async def act(self, time_in_ms: int) -> Tuple[bool, float]:
+    def act(self, time_in_ms: float) -> Tuple[bool, float]:
         """
         Check if the action period has passed and reset the time since last timeout.
         """
@@ -131,16 +133,17 @@ class AudioActionPitch(AudioAction):
 
         self.min_pitch = min_pitch
         self.max_pitch = max_pitch
-        self.chromas: Optional[List[ChromaIndex]] = None
-        self.total_time_in_ms = 0
+        self.chromas: Optional[np.ndarray] = None
+        self.total_time_in_ms: float = 0
 
-    def set_pitches(self, chromas: List[ChromaIndex]) -> None:
+    def set_pitches(self, chromas: np.ndarray) -> None:
         """
-        Set new chromas detected from the audio processing.
+        Set new chromas detected from the audio processing. An array with the ChromaIndex
+        values as integers.
         """
         self.chromas = chromas
 
-    async def act(self, time_in_ms: int) -> Tuple[bool, float]:
+    def act(self, time_in_ms: float) -> Tuple[bool, float]:
         """
         Act based on the chroma detected from the audio processing.
         """
@@ -154,7 +157,7 @@ class AudioActionPitch(AudioAction):
         time_in_sec = int(round(self.total_time_in_ms / 1000))
 
         try:
-            chroma_for_sec = self.chromas[time_in_sec]
+            chroma_for_sec = int(self.chromas[time_in_sec])
         except IndexError:
             raise InvalidPitchSecondError(
                 "Tried to select a second from the chromas we haven't calculated"
@@ -163,7 +166,8 @@ class AudioActionPitch(AudioAction):
         # Check if the chromas are within the range
         if self.min_pitch <= chroma_for_sec <= self.max_pitch:
             logger.info(
-                f"Chroma: {chroma_for_sec} Min pitch: {self.min_pitch} Max pitch: {self.max_pitch}"
+                f"Chroma: {ChromaIndex(chroma_for_sec)} "
+                f"Min pitch: {self.min_pitch} Max pitch: {self.max_pitch}"
             )
             return True, 1.0
         return False, 0.0
@@ -175,6 +179,13 @@ class AudioActions(AudioAction):
         Run multiple audio actions.
         """
         self.actions = audio_actions
+        # Group the actions by type once, instead of checking the type on every audio block
+        self._bpm_actions = [
+            action for action in audio_actions if isinstance(action, AudioActionBPM)
+        ]
+        self._pitch_actions = [
+            action for action in audio_actions if isinstance(action, AudioActionPitch)
+        ]
         self.time_since_last_action_ms = np.inf
         self.blend_falloff_sec = blend_falloff_sec
 
@@ -182,27 +193,24 @@ class AudioActions(AudioAction):
         """
         Set the audio features for all the actions.
         """
-        for action in self.actions:
-            if isinstance(action, AudioActionBPM):
-                if audio_sample_features.bpm is not None:
-                    action.set_bpm(audio_sample_features.bpm)
-            elif isinstance(action, AudioActionPitch):
-                if audio_sample_features.pitches is not None:
-                    action.set_pitches(audio_sample_features.pitches)
+        if audio_sample_features.bpm is not None:
+            for bpm_action in self._bpm_actions:
+                bpm_action.set_bpm(audio_sample_features.bpm)
+        if audio_sample_features.pitches is not None:
+            for pitch_action in self._pitch_actions:
+                pitch_action.set_pitches(audio_sample_features.pitches)
 
-    async def act(self, time_in_ms: int) -> Tuple[bool, float]:
+    def act(self, time_in_ms: float) -> Tuple[bool, float]:
         """
         Act based on the audio features for all the actions.
         """
-        # Run all the actions asynchronously
-        tasks = []
-        async with asyncio.TaskGroup() as tg:
-            for action in self.actions:
-                tasks.append(tg.create_task(action.act(time_in_ms)))
+        # The actions are just arithmetic, run them one after the other. All of them have to
+        # run, even if one already triggered: every action keeps its own clock and skipping one
+        # would make it lose the elapsed time.
+        results_per_action = [action.act(time_in_ms) for action in self.actions]
 
         # Check if according to any action we should act (blend)
-        should_blend_per_action = [task.result() for task in tasks]
-        should_blend = any(should_blend_per_action)
+        should_blend = any(should_act for should_act, _ in results_per_action)
 
         # If we should blend means the action just happened, so we reset the time since last action
         # and the blend strength is 1.0
@@ -1,7 +1,12 @@
 import asyncio
-import struct
-from multiprocessing import Queue
+import functools
+import threading
+from collections import deque
+from multiprocessing import Event
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Event as EventType
 from pathlib import Path
+from typing import Deque, Optional, Tuple
 
 import librosa
 import numpy as np
@@ -11,35 +16,47 @@ import structlog
 from nite.audio.audio import AudioFormat, short_format
 from nite.audio.audio_action import AudioActions
 from nite.audio.audio_processing import AudioProcessor, AudioSampleFeatures
-from nite.config import AUDIO_CHANNELS, AUDIO_SAMPLING_RATE
+from nite.config import AUDIO_CHANNELS, AUDIO_FRAMES_PER_BUFFER, AUDIO_SAMPLING_RATE
+from nite.video_mixer.buffers import AudioBufferPool
 from nite.video_mixer.time_recorder import TimeRecorder
 
 logger = structlog.get_logger("nite.audio_listener")
 
+# Number of audio blocks that can wait to be processed. Around 0.2 seconds of audio with the
+# default settings, older blocks are discarded if the processing can't keep up.
+MAX_PENDING_AUDIO_BLOCKS = 8
+
+# Time given to the processing and sending threads to finish what they are doing when stopping
+THREADS_JOIN_TIMEOUT_SEC = 2
+
 
 class AudioListener:
     def __init__(
         self,
         audio_processor: AudioProcessor,
         audio_actions: AudioActions,
-        actions_queue: Queue,
+        actions_sender: Connection,
         audio_format: AudioFormat = short_format,
         sample_rate: int = AUDIO_SAMPLING_RATE,
         audio_channels: int = AUDIO_CHANNELS,
+        frames_per_buffer: int = AUDIO_FRAMES_PER_BUFFER,
     ) -> None:
         """
         The audio listener class is meant to listen to audio coming from the
         microphone and process it using the audio processor and audio actions. If
         there's an action to be taken, given the configured actions, and the detected
-        features, it will put the action in the actions queue.
+        features, it will send the action through the actions pipe.
 
         Args:
             audio_processor: In charge of analyzing the audio samples and detect features.
             audio_actions: The configured actions to take given the detected features.
-            actions_queue: The queue to communicate the actions to the video mixer.
+            actions_sender: Sending end of the pipe to communicate the actions to the video
+                mixer.
             audio_format: The format of the audio samples. Defaults to short_format.
             sample_rate: The sampling rate of the audio. Defaults to AUDIO_SAMPLING_RATE.
             audio_channels: The number of audio channels. Defaults to AUDIO_CHANNELS.
+            frames_per_buffer: The number of frames of each audio block. Defaults to
+                AUDIO_FRAMES_PER_BUFFER.
 
         Returns:
             None
@@ -48,57 +65,183 @@ class AudioListener:
         self._audio_format = audio_format
         self._sample_rate = sample_rate
         self._audio_channels = audio_channels
+        self._frames_per_buffer = frames_per_buffer
         self._audio_actions = audio_actions
-        self._actions_queue = actions_queue
+        self._actions_sender = actions_sender
         self._audio_processor.set_sampling_rate(sample_rate)
         self._time_recorder = TimeRecorder()
         logger.info(f"Loaded audio listener. Format: {self._audio_format}")
 
-    async def _get_audio_sample_features(self, audio_sample: np.ndarray) -> AudioSampleFeatures:
+    async def _get_action_from_audio_sample(self, audio_sample: np.ndarray) -> Tuple[bool, float]:
         """
-        Use the audio processor to get the features of the audio sample.
+        Use the audio processor to get the features of the audio sample and ask the audio
+        actions if there's an action to take.
         """
         audio_sample_features = await self._audio_processor.process_audio_sample(audio_sample)
-        return audio_sample_features
+        self._audio_actions.set_features(audio_sample_features)
+        return self._audio_actions.act(self._time_recorder.elapsed_time_in_ms_since_last_asked)
 
-    def _process_audio_block(self, in_data, frame_count, time_info, status):
+    def _process_audio_block(
+        self,
+        in_data,
+        frame_count,
+        time_info,
+        status,
+        *,
+        numpy_dtype: np.dtype,
+        normalization_factor: np.float32,
+        buffer_pool: AudioBufferPool,
+        pending_blocks: Deque[np.ndarray],
+        blocks_ready: threading.Event,
+    ):
         """
-        The callback function that will process the audio block. PyAudio will call this
-        function every time it has a new audio block ready and process it in a separate
-        thread.
+        The callback function that will receive the audio block. PyAudio will call this
+        function every time it has a new audio block ready in a separate thread.
         [Docs](https://people.csail.mit.edu/hubert/pyaudio/docs/#class-pyaudio-stream)
 
-        Steps taken:
-        1. Unpack the audio block coming from the microphone.
-        2. Get the features of the audio sample.
-        3. Ask the audio actions if there's an action to take.
-        4. If there's an action, put it in the actions queue to communicate it to the video mixer.
+        The callback only normalizes the block to float32 and hands it to the processing
+        thread, a slow detection doesn't make PyAudio drop blocks. If the processing thread
+        falls behind, the oldest pending blocks are discarded.
+
+        The keyword arguments don't change while the stream is open. They are bound once
+        with functools.partial when the listening starts.
         """
-        audio_sample = np.array(
-            struct.unpack(self._audio_format.unpack_format % frame_count, in_data)
-        )
-        audio_sample_features = asyncio.run(self._get_audio_sample_features(audio_sample))
-        self._audio_actions.set_features(audio_sample_features)
-        should_do_action, blend_strength = asyncio.run(
-            self._audio_actions.act(self._time_recorder.elapsed_time_in_ms_since_last_asked)
-        )
-        if should_do_action:
-            self._actions_queue.put(blend_strength)
+        audio_sample_raw = np.frombuffer(in_data, dtype=numpy_dtype)
+        audio_sample = buffer_pool.acquire(len(audio_sample_raw))
+        np.multiply(audio_sample_raw, normalization_factor, out=audio_sample, casting="unsafe")
+        # The processing can't keep up, discard the oldest block and return its buffer to the
+        # pool. A full deque would drop it silently on append.
+        if len(pending_blocks) == pending_blocks.maxlen:
+            try:
+                buffer_pool.release(pending_blocks.popleft())
+            except IndexError:
+                # The processing thread took it meanwhile
+                pass
+        # deque.append is atomic, no lock needed with a single producer and a single consumer
+        pending_blocks.append(audio_sample)
+        blocks_ready.set()
         return in_data, pyaudio.paContinue
 
-    def start(self) -> None:
+    def _process_pending_audio_blocks(
+        self,
+        pending_blocks: Deque[np.ndarray],
+        blocks_ready: threading.Event,
+        stop_processing: threading.Event,
+        buffer_pool: AudioBufferPool,
+        pending_actions: Deque[float],
+        actions_ready: threading.Event,
+    ) -> None:
+        """
+        Runs in its own thread while the stream is open. Processes the audio blocks received by
+        the callback in order.
+
+        Steps taken for every block:
+        1. Get the features of the audio sample.
+        2. Ask the audio actions if there's an action to take.
+        3. If there's an action, hand it to the thread sending the actions to the video mixer.
+        """
+        # Event loop to run the audio processing of every block. Created once in this thread
+        # instead of a new one per block with asyncio.run.
+        event_loop = asyncio.new_event_loop()
+        try:
+            while not stop_processing.is_set():
+                blocks_ready.wait()
+                # Cleared before draining, a block appended meanwhile sets it again
+                blocks_ready.clear()
+                while pending_blocks:
+                    audio_sample = pending_blocks.popleft()
+                    try:
+                        should_do_action, blend_strength = event_loop.run_until_complete(
+                            self._get_action_from_audio_sample(audio_sample)
+                        )
+                    finally:
+                        # The detectors copy the sample into their own buffers
+                        buffer_pool.release(audio_sample)
+                    if should_do_action:
+                        pending_actions.append(blend_strength)
+                        actions_ready.set()
+        finally:
+            event_loop.close()
+
+    def _send_pending_actions(
+        self,
+        pending_actions: Deque[float],
+        actions_ready: threading.Event,
+        stop_processing: threading.Event,
+    ) -> None:
+        """
+        Runs in its own thread while the stream is open. Sends the actions through the actions
+        pipe to the video mixer.
+
+        Sending blocks if the pipe is full, e.g. the video mixer is stalled. Only this thread
+        waits then, the audio keeps being processed and only the latest action is kept.
+        """
+        while not stop_processing.is_set():
+            actions_ready.wait()
+            # Cleared before sending, an action appended meanwhile sets it again
+            actions_ready.clear()
+            while pending_actions:
+                self._actions_sender.send(pending_actions.popleft())
+
+    def start(self, stop_listening: Optional[EventType] = None) -> None:
         """
         Start the audio listening process. It will open the audio stream and keep it alive
-        until a KeyboardInterrupt is received. The audio block processing will be handled
-        by the callback function.
+        until `stop_listening` is set or a KeyboardInterrupt is received. The audio blocks are
+        received by the callback function and processed in a separate thread.
         """
+        if stop_listening is None:
+            stop_listening = Event()
+        pending_blocks: Deque[np.ndarray] = deque(maxlen=MAX_PENDING_AUDIO_BLOCKS)
+        # Reuse the float32 buffers of the normalized audio blocks instead of allocating them.
+        # There's one buffer for every pending block plus the one being processed. Created here,
+        # in the listening process, the pool holds locks and can't be pickled.
+        buffer_pool = AudioBufferPool(
+            self._frames_per_buffer * self._audio_channels,
+            num_buffers=MAX_PENDING_AUDIO_BLOCKS + 2,
+        )
+        blocks_ready = threading.Event()
+        stop_processing = threading.Event()
+        # Only the latest action matters, the older ones are stale once a new one is taken
+        pending_actions: Deque[float] = deque(maxlen=1)
+        actions_ready = threading.Event()
+        processing_thread = threading.Thread(
+            target=self._process_pending_audio_blocks,
+            args=(
+                pending_blocks,
+                blocks_ready,
+                stop_processing,
+                buffer_pool,
+                pending_actions,
+                actions_ready,
+            ),
+            name="nite-audio-processing",
+            daemon=True,
+        )
+        sending_thread = threading.Thread(
+            target=self._send_pending_actions,
+            args=(pending_actions, actions_ready, stop_processing),
+            name="nite-audio-actions",
+            daemon=True,
+        )
+        process_audio_block = functools.partial(
+            self._process_audio_block,
+            numpy_dtype=np.dtype(self._audio_format.numpy_dtype),
+            # The samples are normalized once in float32, the detectors work on them directly
+            normalization_factor=np.float32(self._audio_format.normalization_factor),
+            buffer_pool=buffer_pool,
+            pending_blocks=pending_blocks,
+            blocks_ready=blocks_ready,
+        )
         paud = pyaudio.PyAudio()
+        processing_thread.start()
+        sending_thread.start()
         stream = paud.open(
             format=self._audio_format.pyaudio_format,
             channels=self._audio_channels,
             rate=self._sample_rate,
             input=True,
-            stream_callback=self._process_audio_block,
+            frames_per_buffer=self._frames_per_buffer,
+            stream_callback=process_audio_block,
         )
 
         logger.info("Starting audio listening")
@@ -106,7 +249,12 @@ class AudioListener:
 
         try:
             # Keep the stream alive. The callback function will handle the audio processing.
-            while stream.is_active():
+            # Wait until the next keep-alive instead of spinning, this thread has nothing else
+            # to do. Waiting on the event wakes it up as soon as it is asked to stop.
+            while stream.is_active() and processing_thread.is_alive():
+                if stop_listening.wait(self._time_recorder.time_until_period_passes):
+                    logger.info("Audio listening asked to stop")
+                    break
                 if self._time_recorder.has_period_passed:
                     logger.info(f"Keep-alive. Elapsed time: {self._time_recorder.elapsed_time_str}")
         except KeyboardInterrupt:
@@ -120,6 +268,13 @@ class AudioListener:
             )
             stream.close()
             paud.terminate()
+            stop_processing.set()
+            blocks_ready.set()
+            actions_ready.set()
+            for thread in (processing_thread, sending_thread):
+                thread.join(timeout=THREADS_JOIN_TIMEOUT_SEC)
+                if thread.is_alive():
+                    logger.info(f"Thread {thread.name} didn't stop in time, leaving it behind")
 
 
 class AudioAnalyzerSong:
@@ -1,19 +1,23 @@
 import asyncio
+import functools
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, List, Optional
+from typing import Any, Optional
 
 import librosa
 import numpy as np
 import structlog
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
-from nite.audio.audio import AudioFormat
 from nite.config import AUDIO_SAMPLING_RATE
 from nite.video_mixer.buffers import Buffer, SampleBuffer
+from nite.video_mixer.time_recorder import TimeRecorder
 
 logger = structlog.get_logger("nite.audio_processing")
 
+# Hop length of the onset frames used by librosa's beat tracking at the full sampling rate
+BEAT_TRACK_HOP_LENGTH = 512
+
 
 class ChromaIndex(int, Enum):
     c = 0
@@ -33,10 +37,27 @@ class ChromaIndex(int, Enum):
 class AudioSampleFeatures(BaseModel):
     """
     Available features to detect from the audio samples.
+
+    pitches: The detected ChromaIndex values as an int8 array. Kept as plain integers, they
+    are only compared against ranges.
     """
 
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     bpm: Optional[float] = None
-    pitches: Optional[List[ChromaIndex]] = None
+    pitches: Optional[np.ndarray] = None
+
+
+@functools.lru_cache(maxsize=8)
+def get_chroma_filter(sampling_rate: float, n_fft: int) -> np.ndarray:
+    """
+    Filter bank to project the STFT bins onto the 12 chroma bins. It only depends on the
+    sampling rate and the FFT size, so it's computed once and cached.
+
+    The tuning is fixed to A440. Estimating it on every call, the default of
+    `librosa.feature.chroma_stft`, costs more than the chroma itself.
+    """
+    return librosa.filters.chroma(sr=sampling_rate, n_fft=n_fft, tuning=0.0)
 
 
 class Detector(ABC):
@@ -53,6 +74,8 @@ class BPMDetector(Detector):
         tolerance_threshold: int = 10,
         sampling_rate: float = AUDIO_SAMPLING_RATE,
         reset_after_prediction: bool = False,
+        downsample_factor: int = 1,
+        detection_period_sec: Optional[float] = None,
     ) -> None:
         """
         BPM detector class to detect the BPM of the audio samples.
@@ -60,40 +83,64 @@ class BPMDetector(Detector):
         Initializing the buffer_audio empty will create an empty limitless buffer.
         The reset_after_prediction parameter will reset the buffer after a prediction is made.
         Can be used to not make predictions too often.
+        The downsample_factor averages every N samples before tracking the beats. The beat
+        tracking relies on the low frequencies, a factor of 4 at 44.1 kHz gives the same BPMs
+        with a fraction of the work.
+        The detection_period_sec is the minimum time between two BPM detections. The BPM
+        can't change much between two audio blocks, in between the last average is returned.
+        If not set, the BPM is detected on every call.
         """
+        if downsample_factor < 1:
+            raise ValueError("downsample_factor must be greater than 0")
+
         self.tolerance_threshold = tolerance_threshold
         self.buffer_audio = buffer_audio
         self.buffer_recorded_bpms = buffer_recorded_bpms
         self.sampling_rate = sampling_rate
         self.reset_after_prediction = reset_after_prediction
+        self.downsample_factor = downsample_factor
+        self._detection_timer: Optional[TimeRecorder] = None
+        if detection_period_sec is not None:
+            self._detection_timer = TimeRecorder(period_timeout_sec=detection_period_sec)
+            self._detection_timer.start_recording_if_not_started()
 
     def _has_bpm_changed_significantly(self, last_recorded_bpm: np.ndarray) -> bool:
         """
         Heuristic to check if the BPM has changed significantly.
+
+        The last BPM is compared against the moving average of the recorded BPMs, a single
+        reduction over the buffer instead of an array of distances to every recorded BPM.
         """
         # If we don't have enough data, we can't make a prediction
-        if not self.buffer_recorded_bpms.has_enough_data():
-            return False
-        if len(self.buffer_recorded_bpms.buffered_data) == 0:
+        avg_recorded_bpms = self._get_avg_recorded_bpms()
+        if avg_recorded_bpms is None:
             return False
 
-        # Calculate the absolute distance to the buffered BPMs
-        distance_to_buffered_bpms = np.abs(
-            last_recorded_bpm - self.buffer_recorded_bpms.buffered_data
-        )
-
-        # Calculate the average distance to the buffered BPMs
-        avg_distance_to_buffered_bpms = np.mean(distance_to_buffered_bpms)
-
-        # Check if the average distance is greater than the tolerance threshold.
+        # Check if the distance to the average is greater than the tolerance threshold.
         # If it is, the BPM has changed significantly.
-        has_bpm_changed = avg_distance_to_buffered_bpms > self.tolerance_threshold
-        return has_bpm_changed
+        distance_to_avg_bpm = np.abs(last_recorded_bpm - avg_recorded_bpms)
+        return bool(np.all(distance_to_avg_bpm > self.tolerance_threshold))
 
     def _get_avg_recorded_bpms(self) -> Optional[float]:
         if not self.buffer_recorded_bpms.has_enough_data():
             return None
-        return np.mean(self.buffer_recorded_bpms.buffered_data)
+        recorded_bpms = self.buffer_recorded_bpms.buffered_data
+        if len(recorded_bpms) == 0:
+            return None
+        return float(np.mean(recorded_bpms))
+
+    def _get_downsampled_audio(self) -> np.ndarray:
+        """
+        Average every `downsample_factor` consecutive samples of the buffered audio. The average
+        is a cheap low-pass filter, the high frequencies don't fold back into the band used by
+        the beat tracking as they would keeping one of every N samples.
+        """
+        audio = self.buffer_audio.buffered_data
+        if self.downsample_factor == 1:
+            return audio
+        # Drop the oldest samples that don't fill a whole group
+        audio = audio[len(audio) % self.downsample_factor :]
+        return audio.reshape(-1, self.downsample_factor).mean(axis=1)
 
     def _get_estimated_bpm(self) -> Optional[np.ndarray]:
         """
@@ -105,8 +152,13 @@ class BPMDetector(Detector):
 
         # Using this provides a more accurate BPM estimation on longer tracks but is very slow.
         # _, audio_sample_percussive = librosa.effects.hpss(self.buffer_audio.buffered_data)
+        # Keep the onset frames as long in time as without downsampling, a longer hop gives a
+        # coarser tempo resolution
         last_recorded_bpm, _ = librosa.beat.beat_track(
-            y=self.buffer_audio.buffered_data, sr=self.sampling_rate, start_bpm=120
+            y=self._get_downsampled_audio(),
+            sr=self.sampling_rate / self.downsample_factor,
+            hop_length=max(1, BEAT_TRACK_HOP_LENGTH // self.downsample_factor),
+            start_bpm=120,
         )
         # Standardize the BPM prediction to be a numpy array
         if isinstance(last_recorded_bpm, np.ndarray):
@@ -130,6 +182,10 @@ class BPMDetector(Detector):
         # Add the audio sample to the buffer
         self.buffer_audio.add_sample_to_buffer(audio_sample)
 
+        # Skip the detection if the last one was too recent
+        if self._detection_timer is not None and not self._detection_timer.has_period_passed:
+            return self._get_avg_recorded_bpms()
+
         # Get the estimated BPM
         last_recorded_bpm = self._get_estimated_bpm()
         if last_recorded_bpm is None:
@@ -160,6 +216,7 @@ class PitchDetector(Detector):
         reset_after_prediction: bool = False,
         should_return_latest: bool = False,
         hop_length: int = 512,
+        n_fft: int = 2048,
     ) -> None:
         """
         Pitch detector class to detect the pitch of the audio samples.
@@ -173,22 +230,35 @@ class PitchDetector(Detector):
         self.reset_after_prediction = reset_after_prediction
         self.should_return_latest = should_return_latest
         self.hop_length = hop_length
+        self.n_fft = n_fft
 
     def _get_chromogram(self) -> np.ndarray:
         """
         Make the chromogram estimation using the STFT method.
 
-        Here we're estimating the chroma (pitch) of the audio samples.
+        Here we're estimating the chroma (pitch) of the audio samples. Same as
+        `librosa.feature.chroma_stft` with a fixed tuning, but reusing the cached filter bank.
+        If only the latest chroma is needed only the last STFT frame is projected.
         [Docs](https://librosa.org/doc/0.10.2/generated/librosa.feature.chroma_stft.html)
         """
-        estimated_chromogram = librosa.feature.chroma_stft(
-            y=self.buffer_audio.buffered_data, sr=self.sampling_rate, hop_length=self.hop_length
+        power_spectrogram = (
+            np.abs(
+                librosa.stft(
+                    y=self.buffer_audio.buffered_data,
+                    n_fft=self.n_fft,
+                    hop_length=self.hop_length,
+                )
+            )
+            ** 2
         )
         if self.should_return_latest:
-            return estimated_chromogram[:, -1].reshape(-1, 1)
-        return estimated_chromogram
+            power_spectrogram = power_spectrogram[:, -1:]
+
+        chroma_filter = get_chroma_filter(self.sampling_rate, self.n_fft)
+        estimated_chromogram = chroma_filter @ power_spectrogram
+        return librosa.util.normalize(estimated_chromogram, norm=np.inf, axis=-2)
 
-    async def detect(self, audio_sample_normalized: np.ndarray) -> Optional[List[ChromaIndex]]:
+    async def detect(self, audio_sample_normalized: np.ndarray) -> Optional[np.ndarray]:
         """
         Detect the pitch of the audio samples using the chroma estimation.
         """
@@ -210,38 +280,47 @@ class PitchDetector(Detector):
         # N is the number of frames and 12 is the number of pitches.
         highest_prob_pitchs = np.argmax(chromogram, axis=0)
         if self.should_return_latest:
-            detected_chromas = [ChromaIndex(pitch) for pitch in highest_prob_pitchs]
-            return detected_chromas
+            return highest_prob_pitchs.astype(np.int8)
 
+        return self._get_chromas_per_second(highest_prob_pitchs)
+
+    def _get_chromas_per_second(self, highest_prob_pitchs: np.ndarray) -> np.ndarray:
+        """
+        Pick the most frequent pitch of the chroma frames around every second. The pitches are
+        categories, the mode is taken instead of interpolating between them.
+        """
         # Get the detected chromas frames in seconds
         chromas_timing = librosa.core.frames_to_time(
             np.arange(len(highest_prob_pitchs)),
             sr=self.sampling_rate,
             hop_length=self.hop_length,
         )
-        time_in_seconds = np.arange(0, round(chromas_timing[-1]))
-        detected_chromas_in_sec = np.round(
-            np.interp(time_in_seconds, chromas_timing, highest_prob_pitchs)
-        )
-        detected_chromas = [ChromaIndex(pitch) for pitch in detected_chromas_in_sec]
-        return detected_chromas
+        num_seconds = round(chromas_timing[-1])
+        frames_second = np.round(chromas_timing).astype(np.intp)
+        in_range = frames_second < num_seconds
+        # Count the pitches of every second with a single bincount over (second, pitch) pairs
+        pitch_counts = np.bincount(
+            frames_second[in_range] * len(ChromaIndex) + highest_prob_pitchs[in_range],
+            minlength=num_seconds * len(ChromaIndex),
+        ).reshape(num_seconds, len(ChromaIndex))
+        return np.argmax(pitch_counts, axis=1).astype(np.int8)
 
 
 class AudioProcessor:
     def __init__(
         self,
-        audio_format: Optional[AudioFormat] = None,
         bpm_detector: Optional[BPMDetector] = None,
         pitch_detector: Optional[PitchDetector] = None,
     ) -> None:
         """
         The audio processor class is meant to process audio samples and detect features
         like BPM and pitch. It uses the provided detectors to detect the features.
+
+        The audio samples are expected to be already normalized, e.g. by the AudioListener.
         """
         if bpm_detector is None and pitch_detector is None:
             raise ValueError("At least one detector must be provided.")
 
-        self.audio_format = audio_format
         self.bpm_detector = bpm_detector
         self.pitch_detector = pitch_detector
 
@@ -259,18 +338,13 @@ class AudioProcessor:
         """
         Process the audio sample and detect the features like BPM and pitch.
         """
-        if self.audio_format is not None:
-            audio_sample_normalized = audio_sample * self.audio_format.normalization_factor
-        else:
-            audio_sample_normalized = audio_sample
-
         # Detect BPM and pitch asynchronously
         task_bpm, task_pitch = None, None
         async with asyncio.TaskGroup() as tg:
             if self.bpm_detector is not None:
-                task_bpm = tg.create_task(self.bpm_detector.detect(audio_sample_normalized))
+                task_bpm = tg.create_task(self.bpm_detector.detect(audio_sample))
             if self.pitch_detector is not None:
-                task_pitch = tg.create_task(self.pitch_detector.detect(audio_sample_normalized))
+                task_pitch = tg.create_task(self.pitch_detector.detect(audio_sample))
 
         bpm, pitch = None, None
         if task_bpm is not None:
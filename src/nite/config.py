@@ -5,12 +5,18 @@ from pathlib import Path
 METADATA_FILENAME = os.getenv("METADATA_FILENAME", "metadata.json")
 SUFFIX_NITE_VIDEO_FOLDER = os.getenv("SUFFIX_NITE_VIDEO_FOLDER", "nite_video")
 VIDEO_LOCATION = os.getenv("VIDEO_LOCATION", str(Path(__file__).parent.absolute() / "video"))
+# Number of decoded frames the video reader can have ready before they are consumed
+VIDEO_FRAMES_PREFETCH = int(float(os.getenv("VIDEO_FRAMES_PREFETCH", 32)))
+# Compression level of the PNG frames written to disk, 0-9. Lower is faster but bigger files.
+FRAMES_PNG_COMPRESSION = int(float(os.getenv("FRAMES_PNG_COMPRESSION", 1)))
 
 # Audio variables
 # AUDIO_SAMPLING_RATE in Hz. 44100 is a common value, samples per second.
 AUDIO_SAMPLING_RATE = int(float(os.getenv("AUDIO_SAMPLING_RATE", 44100)))
 # AUDIO_CHANNELS is the number of channels. 1 for mono, 2 for stereo.
 AUDIO_CHANNELS = int(float(os.getenv("AUDIO_CHANNELS", 1)))
+# AUDIO_FRAMES_PER_BUFFER is the number of frames of each audio block read from the microphone.
+AUDIO_FRAMES_PER_BUFFER = int(float(os.getenv("AUDIO_FRAMES_PER_BUFFER", 1024)))
 
 # Audio processing variables
 # These values were found to be the most suitable for the test tracks.
@@ -23,8 +29,14 @@ BPM_BUFFER_BPMS_MIN = int(float(os.getenv("BPM_BUFFER_BPMS_MIN", 3)))
 BPM_BUFFER_BPMS_MAX = int(float(os.getenv("BPM_BUFFER_BPMS_MAX", 3)))
 # Number of seconds to remove after each detection
 BPM_BUFFER_SECS_REMOVE = int(float(os.getenv("BPM_BUFFER_SECS_REMOVE", 0)))
+# Average every N audio samples for BPM detection. Beat tracking doesn't need the full rate.
+BPM_DOWNSAMPLE_FACTOR = int(float(os.getenv("BPM_DOWNSAMPLE_FACTOR", 4)))
+# Minimum number of seconds between two BPM detections. The audio is still buffered in between.
+BPM_DETECTION_PERIOD_SEC = float(os.getenv("BPM_DETECTION_PERIOD_SEC", 1))
 
 # Variables mainly for the video mixer
 KEEPALIVE_TIMEOUT = int(float(os.getenv("KEEPALIVE_TIMEOUT", 5)))
+# Number of frames read ahead of the one being blended and shown in the stream
+STREAM_FRAMES_PREFETCH = int(float(os.getenv("STREAM_FRAMES_PREFETCH", 4)))
 
 LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO")
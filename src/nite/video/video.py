@@ -1,17 +1,67 @@
-import itertools
+import functools
+import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Union
 
 import cv2
+import numpy as np
 import structlog
 from pydantic import BaseModel, computed_field
 
-from nite.config import METADATA_FILENAME
+from nite.config import FRAMES_PNG_COMPRESSION, METADATA_FILENAME
 
 logger = structlog.get_logger("nite.video")
 
 
+def get_resize_interpolation(old_width: int, old_height: int, width: int, height: int) -> int:
+    """
+    INTER_AREA gives the best quality when shrinking and has the fastest SIMD path for 8-bit
+    images. For enlarging it behaves like INTER_NEAREST, use INTER_LINEAR instead.
+    """
+    if width * height < old_width * old_height:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+
+def read_frame(frame_path: Path, flags: int = cv2.IMREAD_COLOR) -> cv2.typing.MatLike:
+    """
+    Read the bytes of a frame from disk and decode them.
+
+    Splitting the read from the decode lets several frames be loaded at the same time in
+    threads, OpenCV releases the GIL while decoding.
+
+    flags: cv2.IMREAD_* flags. Use cv2.IMREAD_GRAYSCALE for alpha frames.
+    """
+    frame_bytes = np.frombuffer(frame_path.read_bytes(), dtype=np.uint8)
+    return cv2.imdecode(frame_bytes, flags)
+
+
+def write_frame(frame_path: Union[str, Path], frame: cv2.typing.MatLike) -> None:
+    """
+    Encode the frame as PNG and write the bytes to disk. OpenCV releases the GIL while encoding,
+    so several frames can be written at the same time in threads.
+    """
+    ret, frame_png = cv2.imencode(
+        ".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, FRAMES_PNG_COMPRESSION]
+    )
+    if not ret:
+        raise ValueError(f"Could not encode frame {frame_path}")
+    with open(frame_path, "wb") as f:
+        f.write(frame_png)
+
+
+def read_frames(
+    frames_paths: List[Path], flags: int = cv2.IMREAD_COLOR
+) -> List[cv2.typing.MatLike]:
+    """
+    Read and decode the frames in parallel. The order of the frames is kept.
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(executor.map(functools.partial(read_frame, flags=flags), frames_paths))
+
+
 class VideoMetadata(BaseModel):
     name: str
     num_frames: float
@@ -59,21 +109,46 @@ class VideoFrames(ABC):
 
 
 class VideoFramesImg(VideoFrames):
-    def __init__(self, metadata: VideoMetadata, frames_imgs: List[cv2.typing.MatLike]) -> None:
+    def __init__(self, metadata: VideoMetadata, frames_imgs: np.ndarray) -> None:
+        """
+        Frames of a video kept in memory.
+
+        frames_imgs: A single contiguous array with shape (num_frames, height, width, channels).
+        Alpha frames have a single plane, shape (num_frames, height, width). Iterating over the
+        first axis yields views of the frames, no copies.
+        """
         super().__init__(metadata)
         self.frames_imgs = frames_imgs
 
     def circular_frame_generator(self):
-        frames_imgs_circular = itertools.cycle(self.frames_imgs)
+        # Index into the array instead of itertools.cycle, which keeps a copy of every item it
+        # has seen. Each frame yielded is a view of the array.
+        frames_imgs = self.frames_imgs
+        num_frames = len(frames_imgs)
+        i_frame = 0
         while True:
-            yield next(frames_imgs_circular)
+            yield frames_imgs[i_frame]
+            i_frame = i_frame + 1 if i_frame + 1 < num_frames else 0
 
     def resize_frames(self, width: int, height: int) -> None:
         super().resize_frames(width, height)
-        self.frames_imgs = [cv2.resize(frame, (width, height)) for frame in self.frames_imgs]
+        num_frames, old_height, old_width = self.frames_imgs.shape[:3]
+        # Empty for alpha frames
+        channels = self.frames_imgs.shape[3:]
+        frames_resized = np.empty((num_frames, height, width, *channels), dtype=np.uint8)
+        interpolation = get_resize_interpolation(old_width, old_height, width, height)
+        # Every frame is resized directly into its slot of the new array
+        for frame, frame_resized in zip(self.frames_imgs, frames_resized):
+            cv2.resize(frame, (width, height), dst=frame_resized, interpolation=interpolation)
+        self.frames_imgs = frames_resized
 
     def convert_to_alpha(self) -> None:
-        self.frames_imgs = [cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA) for frame in self.frames_imgs]
+        # The alpha is a single plane, a quarter of the memory of an interleaved BGRA frame
+        num_frames, height, width, _ = self.frames_imgs.shape
+        frames_alpha = np.empty((num_frames, height, width), dtype=np.uint8)
+        for frame, frame_alpha in zip(self.frames_imgs, frames_alpha):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=frame_alpha)
+        self.frames_imgs = frames_alpha
 
     @property
     def frame_as_img(self):
@@ -81,15 +156,31 @@ class VideoFramesImg(VideoFrames):
 
 
 class VideoFramesPath(VideoFrames):
-    def __init__(self, metadata: VideoMetadata, image_frames_dir: Path) -> None:
+    def __init__(
+        self, metadata: VideoMetadata, image_frames_dir: Path, is_alpha: bool = False
+    ) -> None:
+        """
+        Frames of a video stored as PNG files on disk.
+
+        is_alpha: The frames are an alpha mask. They are stored and read as a single grayscale
+        plane of shape (height, width).
+        """
         super().__init__(metadata)
         self.frames_paths = self.get_frame_paths_from_dir(image_frames_dir)
+        self.is_alpha = is_alpha
+
+    @property
+    def read_flags(self) -> int:
+        return cv2.IMREAD_GRAYSCALE if self.is_alpha else cv2.IMREAD_COLOR
 
     def circular_frame_generator(self):
-        frames_paths_circular = itertools.cycle(self.frames_paths)
+        frames_paths = self.frames_paths
+        num_frames = len(frames_paths)
+        read_flags = self.read_flags
+        i_frame = 0
         while True:
-            frame_path = next(frames_paths_circular)
-            yield cv2.imread(str(frame_path))
+            yield read_frame(frames_paths[i_frame], read_flags)
+            i_frame = i_frame + 1 if i_frame + 1 < num_frames else 0
 
     def resize_frames(self, width: int, height: int):
         super().resize_frames(width, height)
@@ -101,13 +192,22 @@ class VideoFramesPath(VideoFrames):
             return
 
         frames_base_path_resized.mkdir(exist_ok=True, parents=True)
-        new_paths = []
-        for frame_path in self.frames_paths:
-            frame = cv2.imread(str(frame_path))
-            frame_resized = cv2.resize(frame, (width, height))
+
+        read_flags = self.read_flags
+
+        def _resize_frame(frame_path: Path) -> Path:
+            frame = read_frame(frame_path, read_flags)
+            old_height, old_width = frame.shape[:2]
+            interpolation = get_resize_interpolation(old_width, old_height, width, height)
+            frame_resized = cv2.resize(frame, (width, height), interpolation=interpolation)
             frame_resized_path = frames_base_path_resized / frame_path.name
-            new_paths.append(frame_resized_path)
-            cv2.imwrite(str(frame_resized_path), frame_resized)
+            write_frame(frame_resized_path, frame_resized)
+            return frame_resized_path
+
+        # Every frame is read, resized and written in its own thread. Not all the frames are
+        # kept in memory at the same time.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            new_paths = list(executor.map(_resize_frame, self.frames_paths))
 
         self.metadata.to_json(frames_base_path_resized)
         self.frames_paths = new_paths
@@ -119,18 +219,23 @@ class VideoFramesPath(VideoFrames):
         if frames_base_path_alpha.is_dir():
             logger.info("Frames directory found with alpha channel. Not converting.")
             self.frames_paths = self.get_frame_paths_from_dir(frames_base_path_alpha)
+            self.is_alpha = True
             return
 
         frames_base_path_alpha.mkdir(exist_ok=True, parents=True)
-        new_paths = []
-        for frame_path in self.frames_paths:
-            frame = cv2.imread(str(frame_path))
-            frame_alpha = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+
+        def _convert_frame_to_alpha(frame_path: Path) -> Path:
+            # Only a single plane is stored for the alpha
+            frame_alpha = read_frame(frame_path, cv2.IMREAD_GRAYSCALE)
             frame_alpha_path = frames_base_path_alpha / frame_path.name
-            new_paths.append(frame_alpha_path)
-            cv2.imwrite(str(frame_alpha_path), frame_alpha)
+            write_frame(frame_alpha_path, frame_alpha)
+            return frame_alpha_path
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            new_paths = list(executor.map(_convert_frame_to_alpha, self.frames_paths))
 
         self.frames_paths = new_paths
+        self.is_alpha = True
         logger.info(f"Converted frames of {self.metadata.name} to alpha channel.")
 
     def get_frame_paths_from_dir(self, image_frames_dir: Path) -> List[Path]:
@@ -144,4 +249,4 @@ class VideoFramesPath(VideoFrames):
 
     @property
     def frame_as_img(self):
-        return [cv2.imread(str(frame_path)) for frame_path in self.frames_paths]
+        return read_frames(self.frames_paths, self.read_flags)
@@ -1,15 +1,28 @@
+import asyncio
+import functools
 import json
+import os
+import queue
+import re
+import threading
 import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from pathlib import Path
-from typing import AsyncIterator, Optional
+from typing import Any, AsyncIterator, DefaultDict, Deque, Optional
 
 import cv2
 import structlog
 from pydantic import BaseModel
 
-from nite.config import METADATA_FILENAME, SUFFIX_NITE_VIDEO_FOLDER, VIDEO_LOCATION
-from nite.video.video import VideoFramesPath, VideoMetadata
+from nite.config import (
+    METADATA_FILENAME,
+    SUFFIX_NITE_VIDEO_FOLDER,
+    VIDEO_FRAMES_PREFETCH,
+    VIDEO_LOCATION,
+)
+from nite.video.video import VideoFramesPath, VideoMetadata, write_frame
 
 logger = structlog.get_logger("nite.video_io")
 
@@ -18,67 +31,217 @@ class FramesNotFoundError(Exception):
     pass
 
 
-class VideoReader:
-    async def read_metadata_from_video(self, input_video: Path) -> VideoMetadata:
+# Videos are loaded concurrently. Make sure the same frames directory is not written twice at
+# the same time, e.g. if the same video is used as video 1 and video 2.
+_frames_dir_locks: DefaultDict[Path, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# Log the progress of the frames extraction every N frames
+_LOG_EVERY_N_FRAMES = 100
+
+# Name of the directories with the frames of a given resolution, e.g. 1920x1080
+_RESOLUTION_DIR_RE = re.compile(r"^(\d+)x(\d+)$")
+
+
+@functools.lru_cache(maxsize=256)
+def _load_metadata_json(metadata_file: Path, mtime_ns: int) -> VideoMetadata:
+    """
+    Parse the metadata JSON. Cached by path and modification time, so the file is parsed only
+    once unless it changes. Callers must not mutate the returned object, make a copy instead.
+    """
+    with open(metadata_file, "r") as f:
+        metadata = json.load(f)
+    return VideoMetadata(**metadata)
+
+
+@functools.lru_cache(maxsize=256)
+def _find_greatest_resolution_dir(base_frames_dir: Path, mtime_ns: int) -> Path:
+    """
+    Find the subdirectory with the greatest resolution. Cached by path and modification time,
+    the modification time of a directory changes when a subdirectory is added or removed.
+    """
+    greatest_resolution_dir = None
+    greatest_width = -1
+    # DirEntry caches the file type, no extra stat per entry. Names that are not a resolution
+    # are skipped.
+    with os.scandir(base_frames_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            match_resolution = _RESOLUTION_DIR_RE.match(entry.name)
+            if match_resolution is None:
+                continue
+            width = int(match_resolution.group(1))
+            if width > greatest_width:
+                greatest_width, greatest_resolution_dir = width, entry.path
+
+    if greatest_resolution_dir is None:
+        raise FileNotFoundError(f"No frames directory with a resolution in {base_frames_dir}")
+    return Path(greatest_resolution_dir)
+
+
+def open_video_capture(input_video: Path) -> cv2.VideoCapture:
+    """
+    Open the video with the FFmpeg backend, skipping the probing of the other backends. The
+    internal buffer is kept to a single frame, we consume the frames as soon as they are decoded.
+    Falls back to any available backend if OpenCV was built without FFmpeg.
+    """
+    video_capture = cv2.VideoCapture(str(input_video), cv2.CAP_FFMPEG)
+    if not video_capture.isOpened():
         video_capture = cv2.VideoCapture(str(input_video))
-        num_frames = video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
-        fps = video_capture.get(cv2.CAP_PROP_FPS)
-        width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        name = Path(input_video).stem
-        extension = Path(input_video).suffix
-        video_capture.release()
+    video_capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return video_capture
+
+
+class VideoReader:
+    async def read_metadata_from_video(
+        self, input_video: Path, video_capture: cv2.VideoCapture
+    ) -> VideoMetadata:
+        """
+        Read the metadata of the video from an open `video_capture`. The capture is left open,
+        e.g. to read the frames from it afterwards with `from_video`.
+        """
         metadata = VideoMetadata(
-            name=name,
-            num_frames=num_frames,
-            fps=fps,
-            width=width,
-            height=height,
-            extension=extension,
+            name=Path(input_video).stem,
+            num_frames=video_capture.get(cv2.CAP_PROP_FRAME_COUNT),
+            fps=video_capture.get(cv2.CAP_PROP_FPS),
+            width=int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            extension=Path(input_video).suffix,
         )
         logger.info(f"Metadata read from video {input_video}.")
         return metadata
 
     def _read_metadata_from_json(self, input_frames_dir: str) -> VideoMetadata:
-        metadata_file = Path(input_frames_dir) / METADATA_FILENAME
+        metadata_file = (Path(input_frames_dir) / METADATA_FILENAME).resolve()
         if not metadata_file.is_file():
             raise FileNotFoundError(f"Metadata file not found at {metadata_file}")
 
-        with open(metadata_file, "r") as f:
-            metadata = json.load(f)
-
-        metadata = VideoMetadata(**metadata)
+        # The metadata is modified afterwards, e.g. when resizing. Don't change the cached one.
+        metadata = _load_metadata_json(metadata_file, metadata_file.stat().st_mtime_ns).model_copy()
         logger.info(f"Metadata read from JSON {metadata.name}. Metadata: {metadata}")
         return metadata
 
+    def _read_frames_to_queue(
+        self,
+        video_capture: cv2.VideoCapture,
+        metadata: VideoMetadata,
+        frames_queue: queue.Queue,
+        stop_reading: threading.Event,
+    ) -> None:
+        """
+        Decode the frames of the video and put them in the queue. Meant to run in its own
+        thread. A `None` is put in the queue once there are no more frames to read. If decoding
+        fails the exception is put in the queue instead, to be raised by the consumer.
+
+        We don't rely on the number of frames of the metadata to stop, it is not accurate for
+        videos with variable frame rate. We stop as soon as a frame can't be grabbed.
+        """
+        frame_count = 0
+        # Compare against the next frame to log instead of a modulo on every frame
+        num_frames = int(metadata.num_frames)
+        next_log_frame = _LOG_EVERY_N_FRAMES
+        last_item: Optional[Exception] = None
+        try:
+            while video_capture.isOpened() and not stop_reading.is_set():
+                # Extract the frame
+                if not video_capture.grab():
+                    break
+                ret, frame = video_capture.retrieve()
+                if not ret:
+                    break
+                self._put_in_queue(frames_queue, frame, stop_reading)
+                frame_count += 1
+                if frame_count == next_log_frame:
+                    logger.info(f"Frames extracted: {frame_count}/{num_frames}")
+                    next_log_frame += _LOG_EVERY_N_FRAMES
+        except Exception as e:
+            last_item = e
+        finally:
+            video_capture.release()
+            self._put_in_queue(frames_queue, last_item, stop_reading)
+
+    def _put_in_queue(
+        self, frames_queue: queue.Queue, item: Any, stop_reading: threading.Event
+    ) -> None:
+        # Don't block forever if the consumer stopped reading frames
+        while not stop_reading.is_set():
+            try:
+                frames_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get_from_queue(self, frames_queue: queue.Queue, stop_reading: threading.Event) -> Any:
+        # Don't block forever if the consumer stopped, e.g. it was cancelled while waiting
+        while not stop_reading.is_set():
+            try:
+                return frames_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
     async def from_video(
-        self, input_video: Path, metadata: VideoMetadata
+        self,
+        input_video: Path,
+        metadata: VideoMetadata,
+        video_capture: Optional[cv2.VideoCapture] = None,
     ) -> AsyncIterator[cv2.typing.MatLike]:
-        start_time = time.time()
-        video_capture = cv2.VideoCapture(str(input_video))
-        frame_count = 0
+        """
+        Yield the frames of the video. The frames are decoded in a separate thread and handed
+        over through a bounded queue, so the event loop is not blocked by the decoding.
+
+        video_capture: An already open capture of the video, e.g. the one used to read the
+            metadata. It is released once all the frames are read.
+        """
+        start_time = time.perf_counter()
+        if video_capture is None:
+            video_capture = open_video_capture(input_video)
         logger.info(
             f"Converting video {metadata.name} to frames. Number of frames: {metadata.num_frames}"
         )
-        while video_capture.isOpened() and frame_count < metadata.num_frames:
-            # Extract the frame
-            ret, frame = video_capture.read()
-            if not ret:
-                continue
-            # We yield the frame to not keep all the frames in memory
-            yield frame
-            frame_count += 1
-            if frame_count % 100 == 0:
-                logger.info(f"Frames extracted: {frame_count}/{metadata.num_frames}")
-
-        video_capture.release()
-        elapsed_time = time.time() - start_time
+        frames_queue: queue.Queue = queue.Queue(maxsize=VIDEO_FRAMES_PREFETCH)
+        stop_reading = threading.Event()
+        reader = threading.Thread(
+            target=self._read_frames_to_queue,
+            args=(video_capture, metadata, frames_queue, stop_reading),
+            daemon=True,
+        )
+        reader.start()
+
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                frame = await loop.run_in_executor(
+                    None, self._get_from_queue, frames_queue, stop_reading
+                )
+                if frame is None:
+                    break
+                # The reader failed, don't end as if the whole video was read
+                if isinstance(frame, Exception):
+                    raise frame
+                # We yield the frame to not keep all the frames in memory
+                yield frame
+        finally:
+            stop_reading.set()
+            await asyncio.to_thread(reader.join)
+
+        elapsed_time = time.perf_counter() - start_time
         logger.info(
             f"Video {metadata.name} converted to frames in {timedelta(seconds=elapsed_time)} secs"
         )
 
     async def from_frames(
         self, input_frames_dir: Path, width: int, height: int, is_alpha: bool = False
+    ) -> VideoFramesPath:
+        """
+        Load the frames of the video with the given resolution. If the frames don't exist yet
+        in that resolution or with alpha they are created from the greatest resolution
+        available. The resizing and converting is done in a thread to not block the event loop.
+        """
+        return await asyncio.to_thread(self._from_frames, input_frames_dir, width, height, is_alpha)
+
+    def _from_frames(
+        self, input_frames_dir: Path, width: int, height: int, is_alpha: bool
     ) -> VideoFramesPath:
         base_frames_dir = Path(input_frames_dir)
         if not base_frames_dir.is_dir():
@@ -93,7 +256,9 @@ class VideoReader:
         # We have the frames in the desired resolution and with alpha channel
         if image_frames_dir.is_dir():
             metadata = self._read_metadata_from_json(str(image_frames_dir_resol))
-            return VideoFramesPath(metadata=metadata, image_frames_dir=image_frames_dir)
+            return VideoFramesPath(
+                metadata=metadata, image_frames_dir=image_frames_dir, is_alpha=is_alpha
+            )
 
         # We have the frames in the right resolution but are missing the alpha
         if image_frames_dir_resol.is_dir():
@@ -108,11 +273,8 @@ class VideoReader:
                 f"Frames directory for resolution {width}x{height} not found in {base_frames_dir}. "
                 "Creating it."
             )
-            subdirs_existent_resolution = [
-                subdir for subdir in base_frames_dir.iterdir() if subdir.is_dir()
-            ]
-            greatest_existing_resolution = max(
-                subdirs_existent_resolution, key=lambda x: int(x.stem.split("x")[0])
+            greatest_existing_resolution = _find_greatest_resolution_dir(
+                base_frames_dir.resolve(), base_frames_dir.stat().st_mtime_ns
             )
             metadata = self._read_metadata_from_json(str(greatest_existing_resolution))
             video_frames_paths = VideoFramesPath(
@@ -162,13 +324,27 @@ class VideoWriter:
     #     logger.info(f"Video {self.video_metadata.name} file: {output_video} written")
 
     async def to_frames(self, frames: AsyncIterator[cv2.typing.MatLike]) -> None:
-        i_frame = 0
-        async for frame in frames:
-            out_frame = self.output_dir / f"frame{i_frame:0{self.video_metadata.zero_padding}}.png"
-            cv2.imwrite(str(out_frame), frame)
-            i_frame += 1
-        else:
-            logger.info(f"Frames of {self.video_metadata.name} written to {self.output_dir}")
+        """
+        Write the frames to disk as PNG. The frames are encoded and written in a thread pool.
+        At most `VIDEO_FRAMES_PREFETCH` frames are waiting to be written at any time, so we
+        don't keep the whole video in memory if the encoding is slower than the decoding.
+        """
+        loop = asyncio.get_running_loop()
+        pending_writes: Deque[asyncio.Future] = deque()
+        # Build the path template once instead of a Path and padding format on every frame
+        out_frame_template = os.path.join(
+            self.output_dir, f"frame{{:0{self.video_metadata.zero_padding}d}}.png"
+        )
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            i_frame = 0
+            async for frame in frames:
+                out_frame = out_frame_template.format(i_frame)
+                pending_writes.append(loop.run_in_executor(executor, write_frame, out_frame, frame))
+                if len(pending_writes) >= VIDEO_FRAMES_PREFETCH:
+                    await pending_writes.popleft()
+                i_frame += 1
+            await asyncio.gather(*pending_writes)
+        logger.info(f"Frames of {self.video_metadata.name} written to {self.output_dir}")
 
 
 class VideoStream(BaseModel):
@@ -209,17 +385,31 @@ class NiteVideo:
     async def _try_to_load_video(self) -> None:
         output_video_path = Path(VIDEO_LOCATION)
         video_reader = VideoReader()
-        video_metadata = await video_reader.read_metadata_from_video(self.video_path)
-        video_writer = VideoWriter(video_metadata=video_metadata, output_base_dir=output_video_path)
-        frames = video_reader.from_video(self.video_path, video_metadata)
+        # Open the video only once to read both the metadata and the frames
+        video_capture = await asyncio.to_thread(open_video_capture, self.video_path)
+        try:
+            video_metadata = await video_reader.read_metadata_from_video(
+                self.video_path, video_capture=video_capture
+            )
+            video_writer = VideoWriter(
+                video_metadata=video_metadata, output_base_dir=output_video_path
+            )
+        except BaseException:
+            # Once the frames are read the capture is released by from_video
+            video_capture.release()
+            raise
+        frames = video_reader.from_video(
+            self.video_path, video_metadata, video_capture=video_capture
+        )
         await video_writer.to_frames(frames)
 
     async def load_video(self) -> VideoFramesPath:
-        try:
-            video_frames = await self._try_to_load_frames()
-            return video_frames
-        except FramesNotFoundError:
-            logger.info(f"Frames not found at {self.frames_path}. Loading video...")
-
-        await self._try_to_load_video()
-        return await self._try_to_load_frames()
+        async with _frames_dir_locks[self.frames_path]:
+            try:
+                video_frames = await self._try_to_load_frames()
+                return video_frames
+            except FramesNotFoundError:
+                logger.info(f"Frames not found at {self.frames_path}. Loading video...")
+
+            await self._try_to_load_video()
+            return await self._try_to_load_frames()
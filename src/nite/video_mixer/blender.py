@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -31,13 +31,42 @@ class BlendModes(str, Enum):
     pick = "pick"
 
 
+class BlendBuffers:
+    def __init__(self, shape: Tuple[int, ...]) -> None:
+        """
+        Frames allocated once to hold the intermediate results and the output of the blends,
+        instead of allocating new ones for every frame streamed.
+
+        shape: The shape of the frames blended, (height, width, channels).
+        """
+        self.shape = shape
+        self.alpha_channels = np.empty(shape, dtype=np.uint8)
+        self.video_2_weighted = np.empty(shape, dtype=np.uint8)
+        self.blended = np.empty(shape, dtype=np.uint8)
+
+
 def get_video_2_weighted(
-    video_2: np.ndarray, alpha: Optional[np.ndarray], blend_strength: float
+    video_2: np.ndarray,
+    alpha: Optional[np.ndarray],
+    blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = (
-        video_2 if alpha is None else (255.0 * video_2 * (alpha / 255.0)).astype(np.uint8)
+    video_2_weighted = None if buffers is None else buffers.video_2_weighted
+    if alpha is None:
+        # Scales and saturates to uint8 in a single pass. The blend strength is never negative,
+        # taking the absolute value doesn't change anything.
+        return cv2.convertScaleAbs(video_2, dst=video_2_weighted, alpha=blend_strength)
+    # The alpha is a single plane (height, width), expand it to the color channels
+    alpha_channels = cv2.cvtColor(
+        alpha, cv2.COLOR_GRAY2BGR, dst=None if buffers is None else buffers.alpha_channels
     )
-    return (video_2_weighted * blend_strength).astype(np.uint8)
+    # video_2 * alpha / 255 * blend_strength in a single saturated pass over uint8, without
+    # float temporaries
+    return cv2.multiply(video_2, alpha_channels, dst=video_2_weighted, scale=blend_strength / 255.0)
+
+
+def get_blended_buffer(buffers: Optional[BlendBuffers]) -> Optional[np.ndarray]:
+    return None if buffers is None else buffers.blended
 
 
 def blend_normal(
@@ -45,8 +74,9 @@ def blend_normal(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
     return video_2_weighted
 
 
@@ -55,9 +85,10 @@ def blend_darken(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return np.where(video_1 < video_2_weighted, video_1, video_2_weighted)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    return cv2.min(video_1, video_2_weighted, dst=get_blended_buffer(buffers))
 
 
 def blend_lighten(
@@ -65,9 +96,10 @@ def blend_lighten(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return np.where(video_1 > video_2_weighted, video_1, video_2_weighted)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    return cv2.max(video_1, video_2_weighted, dst=get_blended_buffer(buffers))
 
 
 def blend_multiply(
@@ -75,9 +107,10 @@ def blend_multiply(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return (video_1 * video_2_weighted / 255.0).astype(np.uint8)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    return cv2.multiply(video_1, video_2_weighted, dst=get_blended_buffer(buffers), scale=1 / 255.0)
 
 
 def blend_screen(
@@ -85,9 +118,15 @@ def blend_screen(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return (255.0 * ((1 - video_1) * (1 - video_2_weighted))).astype(np.uint8)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    # 255 - (255 - video_1) * (255 - video_2_weighted) / 255. For uint8, 255 - x is the
+    # bitwise not of x. The operations are done in place in the output frame.
+    blended = cv2.bitwise_not(video_1, dst=get_blended_buffer(buffers))
+    cv2.bitwise_not(video_2_weighted, dst=video_2_weighted)
+    cv2.multiply(blended, video_2_weighted, dst=blended, scale=1 / 255.0)
+    return cv2.bitwise_not(blended, dst=blended)
 
 
 def blend_add(
@@ -95,9 +134,11 @@ def blend_add(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return np.clip(video_1 + video_2_weighted, 0, 255, dtype=np.uint8)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    # Saturated sum, the uint8 values don't wrap around
+    return cv2.add(video_1, video_2_weighted, dst=get_blended_buffer(buffers))
 
 
 def blend_diff(
@@ -105,9 +146,11 @@ def blend_diff(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
-    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength)
-    return np.abs(video_1 - video_2_weighted, dtype=np.uint8)
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength, buffers)
+    # The difference of uint8 values would wrap around before taking the absolute value
+    return cv2.absdiff(video_1, video_2_weighted, dst=get_blended_buffer(buffers))
 
 
 def blend_pick(
@@ -115,6 +158,7 @@ def blend_pick(
     video_2: np.ndarray,
     alpha: Optional[np.ndarray],
     blend_strength: float,
+    buffers: Optional[BlendBuffers] = None,
 ) -> np.ndarray:
     return video_2
 
@@ -135,11 +179,19 @@ class BlenderMath(Blender):
     def __init__(self, blend_mode: BlendModes) -> None:
         super().__init__()
         self.blend_function = blend_functions[blend_mode]
+        # Allocated with the shape of the first frames blended
+        self._buffers: Optional[BlendBuffers] = None
         logger.info(f"Loaded math blender with operation: {blend_mode}")
 
     def blend(self, frames: List[cv2.typing.MatLike], blend_strength: float) -> cv2.typing.MatLike:
+        """
+        The frame returned may be one of the buffers of the blender. It's overwritten by the
+        next blend.
+        """
         video_1, video_2, alpha = frames
-        return self.blend_function(video_1, video_2, alpha, blend_strength=blend_strength)
+        if self._buffers is None or self._buffers.shape != video_1.shape:
+            self._buffers = BlendBuffers(video_1.shape)
+        return self.blend_function(video_1, video_2, alpha, blend_strength, self._buffers)
 
 
 class BlendWithSong:
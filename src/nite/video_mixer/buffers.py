@@ -1,7 +1,9 @@
+import queue
 from abc import ABC, abstractmethod
 from typing import Optional
 
 import numpy as np
+import numpy.typing as npt
 import structlog
 
 from nite.config import AUDIO_SAMPLING_RATE
@@ -39,7 +41,12 @@ class TimedSampleBuffer(Buffer):
         max_seconds_in_buffer: int,
         min_seconds_in_buffer: int,
         buffer_cap_per_sec: int = AUDIO_SAMPLING_RATE,
+        dtype: npt.DTypeLike = np.float32,
     ) -> None:
+        """
+        Buffer of samples that keeps the samples received in the last seconds. The samples
+        added are cast to `dtype`, float32 by default as the normalized audio.
+        """
         super().__init__()
         if max_seconds_in_buffer < 1:
             raise ValueError("max_seconds_in_buffer must be greater than 0")
@@ -54,51 +61,73 @@ class TimedSampleBuffer(Buffer):
         self.min_seconds_in_buffer = min_seconds_in_buffer + 1
         self.timer_buffer = TimeRecorder(period_timeout_sec=1)
         self.buffer_cap_per_sec = buffer_cap_per_sec
-        # Rows are samples, columns are the number of seconds in the buffer
-        self.buffer = np.zeros((self.buffer_cap_per_sec, 1))
-        self.num_samples_per_second = np.zeros(1, dtype=int)
+        self.dtype = dtype
+        # Circular buffer with a row per second, allocated once. The samples of a second
+        # are contiguous in memory.
+        self._seconds_ring = np.zeros(
+            (self.max_seconds_in_buffer, self.buffer_cap_per_sec), dtype=self.dtype
+        )
+        self._samples_per_second_ring = np.zeros(self.max_seconds_in_buffer, dtype=int)
+        # Row of the current second and number of seconds in the buffer
+        self._head = 0
+        self._num_seconds = 1
+
+    def _seconds_order(self) -> np.ndarray:
+        """
+        Rows of the circular buffer from the oldest to the current second.
+        """
+        return (self._head - self._num_seconds + 1 + np.arange(self._num_seconds)) % len(
+            self._seconds_ring
+        )
 
     @property
-    def buffered_data(self) -> np.ndarray:
-        # To make sure we do not have more information than needed in the buffer
-        self._rotate_buffers()
+    def buffer(self) -> np.ndarray:
+        """
+        Rows are samples, columns are the seconds in the buffer from the oldest to the current
+        """
+        return self._seconds_ring[self._seconds_order()].T
+
+    @property
+    def num_samples_per_second(self) -> np.ndarray:
+        return self._samples_per_second_ring[self._seconds_order()]
 
-        self.return_buffer = np.zeros(0)
-        for i_sec, samples_per_sec in enumerate(self.num_samples_per_second):
-            self.return_buffer = np.append(self.return_buffer, self.buffer[:samples_per_sec, i_sec])
-        return self.return_buffer
+    @property
+    def buffered_data(self) -> np.ndarray:
+        return np.concatenate(
+            [
+                self._seconds_ring[i_sec, : self._samples_per_second_ring[i_sec]]
+                for i_sec in self._seconds_order()
+            ]
+        )
 
     def has_enough_data(self) -> bool:
-        num_seconds_in_buffer = len(self.num_samples_per_second)
-        data_in_buffer = np.sum(self.num_samples_per_second)
-        return num_seconds_in_buffer >= self.min_seconds_in_buffer and data_in_buffer > 0
+        data_in_buffer = np.sum(self._samples_per_second_ring[self._seconds_order()])
+        return self._num_seconds >= self.min_seconds_in_buffer and data_in_buffer > 0
 
     def reset_buffer(self) -> None:
-        self.buffer = np.zeros((self.buffer_cap_per_sec, 1))
-        self.num_samples_per_second = np.zeros(1, dtype=int)
+        self._seconds_ring[self._head] = 0
+        self._samples_per_second_ring[:] = 0
+        self._num_seconds = 1
 
     def _add_sample_to_buffer(self, sample: np.ndarray) -> None:
-        current_samples = self.num_samples_per_second[-1]
+        current_samples = self._samples_per_second_ring[self._head]
         if current_samples + len(sample) > self.buffer_cap_per_sec:
             logger.warning("Buffer capacity exceeded. Dropping samples.")
             samples_to_add = self.buffer_cap_per_sec - current_samples
-            self.num_samples_per_second[-1] = self.buffer_cap_per_sec
         else:
             samples_to_add = len(sample)
-            self.num_samples_per_second[-1] += samples_to_add
+        self._samples_per_second_ring[self._head] += samples_to_add
 
-        self.buffer[current_samples : current_samples + samples_to_add, -1] = sample[
+        self._seconds_ring[self._head, current_samples : current_samples + samples_to_add] = sample[
             :samples_to_add
         ]
 
     def _add_second_to_buffer(self) -> None:
-        self.num_samples_per_second = np.append(self.num_samples_per_second, [0])
-        self.buffer = np.append(self.buffer, np.zeros((self.buffer_cap_per_sec, 1)), axis=1)
-
-    def _rotate_buffers(self) -> None:
-        if len(self.num_samples_per_second) > self.max_seconds_in_buffer:
-            self.num_samples_per_second = self.num_samples_per_second[-self.max_seconds_in_buffer :]
-            self.buffer = self.buffer[:, -self.max_seconds_in_buffer :]
+        # Reuse the row of the oldest second once the buffer is full
+        self._head = (self._head + 1) % len(self._seconds_ring)
+        self._seconds_ring[self._head] = 0
+        self._samples_per_second_ring[self._head] = 0
+        self._num_seconds = min(self._num_seconds + 1, len(self._seconds_ring))
 
     def remove_samples_from_buffer(self) -> None:
         raise NotImplementedError("This method is not implemented for TimedSampleBuffer")
@@ -111,8 +140,6 @@ class TimedSampleBuffer(Buffer):
 
         self._add_sample_to_buffer(sample)
 
-        self._rotate_buffers()
-
 
 class SampleBuffer(Buffer):
     def __init__(
@@ -120,7 +147,17 @@ class SampleBuffer(Buffer):
         max_buffer_size: Optional[int] = None,
         min_buffer_size: int = 0,
         num_samples_remove: int = 0,
+        dtype: npt.DTypeLike = np.float32,
     ) -> None:
+        """
+        Buffer of samples, e.g. audio samples. The samples added are cast to `dtype`. Audio is
+        normalized to float32 when it's read, so float32 is the default.
+
+        With a `max_buffer_size` the samples are kept in a circular array allocated once.
+        The array is mirrored, every sample is written twice at `i` and `i + max_buffer_size`,
+        so the buffered samples are always contiguous and returned as a view without copying.
+        Without it the samples are appended to an array that doubles its size when it's full.
+        """
         super().__init__()
         if min_buffer_size < 0:
             raise ValueError("min_buffer_size must be equal or greater than 0")
@@ -128,28 +165,124 @@ class SampleBuffer(Buffer):
         if max_buffer_size is not None and max_buffer_size < min_buffer_size:
             raise ValueError("max_buffer_size must be equal or greater than min_buffer_size")
 
-        self.buffer = np.zeros(0)
+        self.dtype = dtype
         self.max_buffer_size = max_buffer_size
         self.min_buffer_size = min_buffer_size
         self.samples_to_remove = num_samples_remove
+        if max_buffer_size is not None:
+            # Both rows are the same circular buffer, assigning to a column writes both halves
+            self._mirrored_ring = np.zeros((2, max_buffer_size), dtype=self.dtype)
+            self._samples = self._mirrored_ring.reshape(-1)
+        else:
+            self._samples = np.zeros(min_buffer_size, dtype=self.dtype)
+        # Index of the oldest sample in self._samples and number of samples buffered
+        self._start = 0
+        self._size = 0
+        # Index in the circular buffer where the next sample is written
+        self._write_idx = 0
+
+    @property
+    def buffer(self) -> np.ndarray:
+        return self.buffered_data
 
     @property
     def buffered_data(self) -> np.ndarray:
-        return self.buffer
+        """
+        Read-only view of the samples in the order they were added. It's only valid until the
+        buffer is modified again.
+        """
+        data = self._samples[self._start : self._start + self._size]
+        data.flags.writeable = False
+        return data
 
     def has_enough_data(self) -> bool:
-        return len(self.buffer) >= self.min_buffer_size
+        return self._size >= self.min_buffer_size
 
     def reset_buffer(self) -> None:
-        self.buffer = np.zeros(0)
-
-    def _rotate_buffer(self) -> None:
-        if self.max_buffer_size is not None and len(self.buffer) > self.max_buffer_size:
-            self.buffer = self.buffer[-self.max_buffer_size :]
+        self._start = 0
+        self._size = 0
+        self._write_idx = 0
 
     def remove_samples_from_buffer(self) -> None:
-        self.buffer = self.buffer[self.samples_to_remove :]
+        samples_to_remove = min(self.samples_to_remove, self._size)
+        self._start += samples_to_remove
+        self._size -= samples_to_remove
+
+    def _add_sample_to_ring(self, sample: np.ndarray, max_buffer_size: int) -> None:
+        if len(sample) >= max_buffer_size:
+            # Only the newest samples fit, they replace the whole ring
+            self._mirrored_ring[:] = sample[len(sample) - max_buffer_size :]
+            self._write_idx = 0
+            self._size = max_buffer_size
+        else:
+            first_chunk = min(len(sample), max_buffer_size - self._write_idx)
+            self._mirrored_ring[:, self._write_idx : self._write_idx + first_chunk] = sample[
+                :first_chunk
+            ]
+            self._mirrored_ring[:, : len(sample) - first_chunk] = sample[first_chunk:]
+            self._write_idx = (self._write_idx + len(sample)) % max_buffer_size
+            self._size = min(self._size + len(sample), max_buffer_size)
+        # The newest sample is always right before the second copy of the write index
+        self._start = self._write_idx + max_buffer_size - self._size
+
+    def _append_sample(self, sample: np.ndarray) -> None:
+        if self._start + self._size + len(sample) > len(self._samples):
+            # Move the samples to the front, growing the array if they don't fit
+            new_capacity = max(len(self._samples), self._size + len(sample))
+            if self._size + len(sample) > len(self._samples) // 2:
+                new_capacity = max(new_capacity, 2 * len(self._samples))
+            new_samples = np.zeros(new_capacity, dtype=self.dtype)
+            new_samples[: self._size] = self.buffered_data
+            self._samples = new_samples
+            self._start = 0
+
+        end = self._start + self._size
+        self._samples[end : end + len(sample)] = sample
+        self._size += len(sample)
 
     def add_sample_to_buffer(self, sample: np.ndarray) -> None:
-        self.buffer = np.append(self.buffer, sample, axis=0)
-        self._rotate_buffer()
+        sample = np.asarray(sample)
+        if len(sample) == 0:
+            return
+        if self.max_buffer_size is None:
+            self._append_sample(sample)
+        elif self.max_buffer_size > 0:
+            self._add_sample_to_ring(sample, self.max_buffer_size)
+
+
+class AudioBufferPool:
+    def __init__(
+        self, buffer_size: int, num_buffers: int = 4, dtype: npt.DTypeLike = np.float32
+    ) -> None:
+        """
+        Pool of preallocated buffers for the audio blocks. The audio callback acquires a buffer,
+        writes the block in it and releases it once it's processed, so no array is allocated
+        per block.
+
+        Buffers of a different size than `buffer_size` are not pooled, they are allocated
+        when acquired and discarded when released. Same if the pool runs out of buffers.
+        """
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be greater than 0")
+
+        self.buffer_size = buffer_size
+        self.dtype = dtype
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=num_buffers)
+        for _ in range(num_buffers):
+            self._pool.put_nowait(np.empty(buffer_size, dtype=self.dtype))
+
+    def acquire(self, size: int) -> np.ndarray:
+        if size != self.buffer_size:
+            return np.empty(size, dtype=self.dtype)
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return np.empty(size, dtype=self.dtype)
+
+    def release(self, buffer: np.ndarray) -> None:
+        if len(buffer) != self.buffer_size:
+            return
+        try:
+            self._pool.put_nowait(buffer)
+        except queue.Full:
+            pass
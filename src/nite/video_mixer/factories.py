@@ -1,13 +1,13 @@
 import asyncio
 from abc import ABC, abstractmethod
-from multiprocessing import Queue
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
 from pathlib import Path
 from typing import List, Optional, Tuple
 
 import structlog
 
 import nite.config as nite_config
-from nite.audio.audio import short_format
 from nite.audio.audio_action import (
     AudioAction,
     AudioActionBPM,
@@ -16,7 +16,7 @@ from nite.audio.audio_action import (
     BPMActionFrequency,
     ChromaIndex,
 )
-from nite.audio.audio_io import AudioAnalyzerSong, AudioFormat, AudioListener
+from nite.audio.audio_io import AudioAnalyzerSong, AudioListener
 from nite.audio.audio_processing import AudioProcessor, BPMDetector, PitchDetector
 from nite.video.video import VideoFramesPath
 from nite.video.video_io import NiteVideo, VideoStream
@@ -65,6 +65,8 @@ class BPMDetectorFactory(NiteFactory):
             buffer_audio=buffer_audio,
             buffer_recorded_bpms=buffer_recorded_bpms,
             sampling_rate=self.sample_rate,
+            downsample_factor=nite_config.BPM_DOWNSAMPLE_FACTOR,
+            detection_period_sec=nite_config.BPM_DETECTION_PERIOD_SEC,
         )
 
     async def get_song_config(self) -> BPMDetector:
@@ -98,7 +100,7 @@ class AudioFactory(NiteFactory):
         min_pitch: Optional[int],
         max_pitch: Optional[int],
         blend_falloff: float,
-        actions_queue: Optional[Queue] = None,
+        actions_sender: Optional[Connection] = None,
     ) -> None:
         self._validate_settings(bpm_frequency, min_pitch, max_pitch)
         self.bpm_action = None
@@ -113,7 +115,7 @@ class AudioFactory(NiteFactory):
                 min_pitch=ChromaIndex(min_pitch), max_pitch=ChromaIndex(max_pitch)
             )
 
-        self._actions_queue = actions_queue
+        self._actions_sender = actions_sender
 
     def _validate_settings(
         self,
@@ -141,17 +143,12 @@ class AudioFactory(NiteFactory):
         self,
         bpm_detector: Optional[BPMDetector],
         pitch_detector: Optional[PitchDetector],
-        audio_format: Optional[AudioFormat],
     ) -> AudioProcessor:
-        return AudioProcessor(
-            bpm_detector=bpm_detector,
-            pitch_detector=pitch_detector,
-            audio_format=audio_format,
-        )
+        return AudioProcessor(bpm_detector=bpm_detector, pitch_detector=pitch_detector)
 
     async def get_stream_config(self) -> Tuple[AudioListener, AudioActions]:
-        if self._actions_queue is None:
-            raise InitMixerError("Actions Queue must be set when initializing audio strem.")
+        if self._actions_sender is None:
+            raise InitMixerError("Actions sender must be set when initializing audio strem.")
         bpm_detector, pitch_detector = None, None
         if self.bpm_action is not None:
             bpm_detector_factory = BPMDetectorFactory(nite_config.AUDIO_SAMPLING_RATE)
@@ -160,11 +157,9 @@ class AudioFactory(NiteFactory):
             pitch_detector_factory = PitchDetectorFactory(nite_config.AUDIO_SAMPLING_RATE)
             pitch_detector = await pitch_detector_factory.get_stream_config()
         audio_actions = self._init_audio_actions()
-        audio_processor = self._init_audio_processor(
-            bpm_detector, pitch_detector, audio_format=short_format
-        )
+        audio_processor = self._init_audio_processor(bpm_detector, pitch_detector)
         return AudioListener(
-            actions_queue=self._actions_queue,
+            actions_sender=self._actions_sender,
             audio_processor=audio_processor,
             audio_actions=audio_actions,
         ), audio_actions
@@ -178,9 +173,7 @@ class AudioFactory(NiteFactory):
             pitch_detector_factory = PitchDetectorFactory(None)
             pitch_detector = await pitch_detector_factory.get_song_config()
         audio_actions = self._init_audio_actions()
-        audio_processor = self._init_audio_processor(
-            bpm_detector, pitch_detector, audio_format=None
-        )
+        audio_processor = self._init_audio_processor(bpm_detector, pitch_detector)
         return AudioAnalyzerSong(audio_processor), audio_actions
 
 
@@ -193,7 +186,7 @@ class VideoFactory(NiteFactory):
         video_2: Path,
         alpha: Path,
         blend_operation: str,
-        actions_queue: Optional[Queue] = None,
+        actions_receiver: Optional[Connection] = None,
         audio_actions: Optional[AudioActions] = None,
     ) -> None:
         self.width = width
@@ -202,7 +195,7 @@ class VideoFactory(NiteFactory):
         self.video_2 = video_2
         self.alpha = alpha
         self.blend_operation = blend_operation
-        self._actions_queue = actions_queue
+        self._actions_receiver = actions_receiver
         self.audio_actions = audio_actions
 
     async def _init(self) -> Tuple[List[VideoFramesPath], BlendWithSong]:
@@ -236,10 +229,10 @@ class VideoFactory(NiteFactory):
         return BlendWithSong(blender_math)
 
     async def get_stream_config(self) -> VideoCombinerQueue:
-        if self._actions_queue is None:
-            raise InitMixerError("Actions Queue must be set when initializing video stream.")
+        if self._actions_receiver is None:
+            raise InitMixerError("Actions receiver must be set when initializing video stream.")
         videos, blender = await self._init()
-        return VideoCombinerQueue(videos, blender, self._actions_queue)
+        return VideoCombinerQueue(videos, blender, self._actions_receiver)
 
     async def get_song_config(self) -> VideoCombinerSong:
         if self.audio_actions is None:
@@ -281,7 +274,8 @@ class VideoCombinerFactory:
         if self.playback_time_sec is None:
             raise InitMixerError("Playback time must be set when initializing video stream.")
 
-        actions_queue: Queue = Queue()
+        # The audio listener only sends and the video combiner only receives
+        actions_receiver, actions_sender = Pipe(duplex=False)
         video_factory = VideoFactory(
             video_1=self.video_1,
             video_2=self.video_2,
@@ -289,14 +283,14 @@ class VideoCombinerFactory:
             width=self.width,
             height=self.height,
             blend_operation=self.blend_operation,
-            actions_queue=actions_queue,
+            actions_receiver=actions_receiver,
         )
         audio_factory = AudioFactory(
             bpm_frequency=self.bpm_frequency,
             min_pitch=self.min_pitch,
             max_pitch=self.max_pitch,
             blend_falloff=self.blend_falloff,
-            actions_queue=actions_queue,
+            actions_sender=actions_sender,
         )
         video_combiner_queue = await video_factory.get_stream_config()
         audio_listener, _ = await audio_factory.get_stream_config()
@@ -304,7 +298,8 @@ class VideoCombinerFactory:
             video_combiner_queue=video_combiner_queue,
             audio_listener=audio_listener,
             playback_time_sec=self.playback_time_sec,
-            actions_queue=actions_queue,
+            actions_receiver=actions_receiver,
+            actions_sender=actions_sender,
         )
 
     async def get_song_config(self) -> VideoCombinerSong:
@@ -1,15 +1,18 @@
-import asyncio
+import queue
+import threading
 import time
 from abc import ABC, abstractmethod
-from multiprocessing import Process, Queue
-from queue import Empty as QueueEmpty
-from typing import List
+from multiprocessing import Event, Process
+from multiprocessing.connection import Connection
+from multiprocessing.synchronize import Event as EventType
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
 import cv2
 import structlog
 
 from nite.audio.audio_action import AudioActions
 from nite.audio.audio_io import AudioListener
+from nite.config import STREAM_FRAMES_PREFETCH
 from nite.video.video import VideoFramesPath
 from nite.video_mixer.blender import BlendWithSong
 from nite.video_mixer.time_recorder import TimeRecorder
@@ -17,10 +20,55 @@ from nite.video_mixer.time_recorder import TimeRecorder
 logger = structlog.get_logger("nite.streamer")
 
 
+WINDOW_NAME = "frame combined"
+
+# Time given to the subprocesses to stop on their own before terminating them
+SUBPROCESS_STOP_TIMEOUT_SEC = 2
+
+
+def open_window() -> None:
+    """
+    Open the window where the stream is shown. An OpenGL window draws the frame on the GPU,
+    it falls back to a normal window if OpenCV was built without OpenGL support.
+    """
+    try:
+        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_OPENGL | cv2.WINDOW_AUTOSIZE)
+    except cv2.error:
+        logger.info("OpenCV built without OpenGL support, using a normal window")
+        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_AUTOSIZE)
+
+
+def wait_until(deadline: float, period: float) -> float:
+    """
+    Sleep until `deadline`, a time.perf_counter() value, and return the deadline of the next
+    period. If the deadline was already missed, the next deadline is a whole period from now
+    instead of trying to catch up by rushing the next frames.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+        return deadline + period
+    return time.perf_counter() + period
+
+
 class TerminateTaskGroupError(Exception):
     """Exception raised to terminate a task group."""
 
 
+def run_and_notify(
+    target: Callable[[EventType], None], stop: EventType, finished: EventType
+) -> None:
+    """
+    Run the target until it returns or the `stop` event is set, and set the `finished` event
+    when it stops. Meant to be the target of a subprocess, so the parent is woken up as soon as
+    the subprocess stops.
+    """
+    try:
+        target(stop)
+    finally:
+        finished.set()
+
+
 class VideoCombiner(ABC):
     def __init__(self, videos: List[VideoFramesPath], blender: BlendWithSong) -> None:
         self.time_recorder = TimeRecorder()
@@ -49,11 +97,68 @@ class VideoCombiner(ABC):
             )
 
     def _calculate_ms_between_frames(self) -> int:
-        sum_fps = sum([video.metadata.fps for video in self.videos])
-        average_fps = sum_fps / len(self.videos)
-        ms_to_wait = int(1000 / average_fps)
+        # Go at the pace of the slowest video, every video advances one frame per frame shown.
+        # No video is played faster than it was recorded and no frames are read for nothing.
+        slowest_fps = min(video.metadata.fps for video in self.videos)
+        # Wait at least 1 ms between frames
+        ms_to_wait = max(1, int(1000 / slowest_fps))
         return ms_to_wait
 
+    def _put_in_queue(
+        self, frames_queue: queue.Queue, item: Any, stop_reading: threading.Event
+    ) -> None:
+        # Don't block forever if the stream stopped taking frames
+        while not stop_reading.is_set():
+            try:
+                frames_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _read_frames_to_queue(
+        self, frames_queue: queue.Queue, stop_reading: threading.Event
+    ) -> None:
+        """
+        Read the next frame of every video and put them together in the queue. Meant to run in
+        its own thread. The videos are cycled, it runs until `stop_reading` is set. If reading
+        fails the exception is put in the queue, to be raised by the consumer. A `None` is put
+        if the videos run out of frames.
+        """
+        last_item: Optional[Exception] = None
+        try:
+            generators = [video.circular_frame_generator() for video in self.videos]
+            for frames in zip(*generators):
+                if stop_reading.is_set():
+                    return
+                self._put_in_queue(frames_queue, frames, stop_reading)
+        except Exception as e:
+            last_item = e
+        self._put_in_queue(frames_queue, last_item, stop_reading)
+
+    def _prefetched_frames(self) -> Iterator[Tuple[cv2.typing.MatLike, ...]]:
+        """
+        Yield the frames of the videos to blend. The frames are read from disk in a separate
+        thread, so the next frames are read while the current one is blended and shown.
+        """
+        frames_queue: queue.Queue = queue.Queue(maxsize=STREAM_FRAMES_PREFETCH)
+        stop_reading = threading.Event()
+        reader = threading.Thread(
+            target=self._read_frames_to_queue, args=(frames_queue, stop_reading), daemon=True
+        )
+        reader.start()
+        try:
+            while True:
+                frames = frames_queue.get()
+                if frames is None:
+                    return
+                # The reader failed, e.g. a frame is missing on disk
+                if isinstance(frames, Exception):
+                    raise frames
+                yield frames
+        finally:
+            stop_reading.set()
+            reader.join()
+
     @abstractmethod
     def stream(self) -> None:
         pass
@@ -70,23 +175,34 @@ class VideoCombinerSong(VideoCombiner):
         self.actions = actions
 
     def stream(self) -> None:
-        generators = [video.circular_frame_generator() for video in self.videos]
         logger.info("Starting stream")
-        self.time_recorder.start_recording_if_not_started()
+        time_recorder = self.time_recorder
+        time_recorder.start_recording_if_not_started()
+        # Local names for what is used on every frame
+        act = self.actions.act
+        blend = self.blender.blend
+        imshow = cv2.imshow
+        poll_key = cv2.pollKey
+        ms_to_wait = self.ms_to_wait
+        # The frames are paced with a clock, cv2.pollKey only handles the window events
+        frame_period = ms_to_wait / 1000
+        open_window()
+        next_frame_time = time.perf_counter() + frame_period
         try:
-            for frames in zip(*generators):
-                should_blend, blend_strength = asyncio.run(self.actions.act(self.ms_to_wait))
-                frame = self.blender.blend(
+            for frames in self._prefetched_frames():
+                should_blend, blend_strength = act(ms_to_wait)
+                frame = blend(
                     frames,  # type: ignore[arg-type]
                     should_blend=should_blend,
                     blend_strength=blend_strength,
                 )
 
-                if self.time_recorder.has_period_passed:
-                    logger.info(f"Keep-alive. Elapsed time: {self.time_recorder.elapsed_time_str}")
+                if time_recorder.has_period_passed:
+                    logger.info(f"Keep-alive. Elapsed time: {time_recorder.elapsed_time_str}")
 
-                cv2.imshow("frame combined", frame)
-                cv2.waitKey(self.ms_to_wait)
+                imshow(WINDOW_NAME, frame)
+                poll_key()
+                next_frame_time = wait_until(next_frame_time, frame_period)
         except KeyboardInterrupt:
             logger.info("Stream stopped")
             cv2.destroyAllWindows()
@@ -97,29 +213,52 @@ class VideoCombinerQueue(VideoCombiner):
         self,
         videos: List[VideoFramesPath],
         blender: BlendWithSong,
-        actions_queue: Queue,
+        actions_receiver: Connection,
     ) -> None:
         super().__init__(videos, blender)
-        self._actions_queue = actions_queue
+        self._actions_receiver = actions_receiver
 
-    def stream(self) -> None:
+    def _drain_actions(self, max_batch: int = 64) -> Optional[float]:
+        """
+        Receive all the blend strengths waiting in the pipe, up to `max_batch`, and return the
+        latest one. The older ones are stale by the time the frame is shown. Returns None if
+        nothing was received. poll() doesn't block.
+        """
+        blend_strength = None
+        for _ in range(max_batch):
+            if not self._actions_receiver.poll():
+                break
+            blend_strength = self._actions_receiver.recv()
+        return blend_strength
+
+    def stream(self, stop_streaming: Optional[EventType] = None) -> None:
         """
         Get the frames from the videos and blend them. The blend strength will be received from the
-        actions queue.
+        actions pipe. Runs until `stop_streaming` is set or a KeyboardInterrupt is received.
         """
+        if stop_streaming is None:
+            stop_streaming = Event()
 
-        # Combine the frames from the videos to iterate infinitely over them
-        generators = [video.circular_frame_generator() for video in self.videos]
         logger.info("Starting stream")
-        self.time_recorder.start_recording_if_not_started()
+        time_recorder = self.time_recorder
+        time_recorder.start_recording_if_not_started()
+        # Local names for what is used on every frame
+        drain_actions = self._drain_actions
+        blend = self.blender.blend
+        imshow = cv2.imshow
+        poll_key = cv2.pollKey
+        ms_to_wait = self.ms_to_wait
+        # The frames are paced with a clock, cv2.pollKey only handles the window events
+        frame_period = ms_to_wait / 1000
+        open_window()
+        next_frame_time = time.perf_counter() + frame_period
         try:
-            # Iterate over the frames and blend them
-            for frames in zip(*generators):
-                try:
-                    blend_strength = self._actions_queue.get_nowait()
-                except QueueEmpty:
-                    # No blend strength received
-                    blend_strength = None
+            # Iterate infinitely over the frames of the videos and blend them
+            for frames in self._prefetched_frames():
+                if stop_streaming.is_set():
+                    break
+
+                blend_strength = drain_actions()
 
                 if blend_strength is not None:
                     should_blend = True
@@ -128,18 +267,19 @@ class VideoCombinerQueue(VideoCombiner):
                     blend_strength = 0
 
                 # Get the blended frame
-                frame = self.blender.blend(
+                frame = blend(
                     frames,  # type: ignore[arg-type]
                     should_blend=should_blend,
                     blend_strength=blend_strength,
                 )
 
-                if self.time_recorder.has_period_passed:
-                    logger.info(f"Keep-alive. Elapsed time: {self.time_recorder.elapsed_time_str}")
+                if time_recorder.has_period_passed:
+                    logger.info(f"Keep-alive. Elapsed time: {time_recorder.elapsed_time_str}")
 
                 # Show the blended frame using OpenCV
-                cv2.imshow("frame combined", frame)
-                cv2.waitKey(self.ms_to_wait)
+                imshow(WINDOW_NAME, frame)
+                poll_key()
+                next_frame_time = wait_until(next_frame_time, frame_period)
         except KeyboardInterrupt:
             logger.info(
                 f"Stream stopped forcefully. Elapsed time: {self.time_recorder.elapsed_time_str}"
@@ -155,12 +295,14 @@ class VideoCombinerAudioListenerQueue(VideoCombiner):
         video_combiner_queue: VideoCombinerQueue,
         audio_listener: AudioListener,
         playback_time_sec: int,
-        actions_queue: Queue,
+        actions_receiver: Connection,
+        actions_sender: Connection,
     ) -> None:
         self._video_combiner_queue = video_combiner_queue
         self._audio_listener = audio_listener
         self._playback_time_sec = playback_time_sec
-        self._actions_queue = actions_queue
+        self._actions_receiver = actions_receiver
+        self._actions_sender = actions_sender
 
     def stream(self) -> None:
         """
@@ -171,18 +313,38 @@ class VideoCombinerAudioListenerQueue(VideoCombiner):
         """
         logger.info(f"Starting stream for {self._playback_time_sec} seconds")
 
-        video_combiner_sub = Process(target=self._video_combiner_queue.stream, daemon=True)
-        audio_listener_sub = Process(target=self._audio_listener.start, daemon=True)
+        # Set by any of the subprocesses when it stops, no need to wait the whole playback time
+        # if the stream can't go on
+        subprocess_finished = Event()
+        # Set to ask the subprocesses to stop, they check it on every frame or keep-alive
+        stop_subprocesses = Event()
+        video_combiner_sub = Process(
+            target=run_and_notify,
+            args=(self._video_combiner_queue.stream, stop_subprocesses, subprocess_finished),
+            daemon=True,
+        )
+        audio_listener_sub = Process(
+            target=run_and_notify,
+            args=(self._audio_listener.start, stop_subprocesses, subprocess_finished),
+            daemon=True,
+        )
 
         video_combiner_sub.start()
         audio_listener_sub.start()
 
         try:
-            time.sleep(self._playback_time_sec)
-            logger.info("Stream finished")
+            if subprocess_finished.wait(timeout=self._playback_time_sec):
+                logger.info("Stream finished early, one of the processes stopped")
+            else:
+                logger.info("Stream finished")
         except KeyboardInterrupt:
             logger.info("Stream stopped forcefully")
         finally:
-            audio_listener_sub.terminate()
-            video_combiner_sub.terminate()
-            self._actions_queue.close()
+            stop_subprocesses.set()
+            for subprocess in (audio_listener_sub, video_combiner_sub):
+                subprocess.join(timeout=SUBPROCESS_STOP_TIMEOUT_SEC)
+                if subprocess.is_alive():
+                    logger.info(f"Process {subprocess.name} didn't stop in time, terminating it")
+                    subprocess.terminate()
+            self._actions_sender.close()
+            self._actions_receiver.close()
@@ -1,9 +1,9 @@
 import time
+from dataclasses import dataclass
 from datetime import timedelta
 from typing import Optional
 
 import structlog
-from pydantic import BaseModel, computed_field, field_validator
 
 from nite.config import KEEPALIVE_TIMEOUT
 
@@ -14,61 +14,73 @@ class TimeRecorderError(Exception):
     pass
 
 
-class TimeRecorder(BaseModel):
+@dataclass(slots=True)
+class TimeRecorder:
+    """
+    Keep track of the elapsed time. It is checked on every frame of the stream and on every
+    audio block, hence a plain dataclass instead of a pydantic model. The times are taken with
+    `time.perf_counter`, a monotonic clock.
+    """
+
     start_time: Optional[float] = None
     time_from_last_timeout: Optional[float] = None
     period_timeout_sec: float = KEEPALIVE_TIMEOUT
     time_from_last_asked: Optional[float] = None
 
-    @field_validator("period_timeout_sec")
-    @classmethod
-    def period_timeout_sec_not_zero(cls, period_timeout_sec):
-        if period_timeout_sec <= 0:
+    def __post_init__(self) -> None:
+        if self.period_timeout_sec <= 0:
             raise ValueError("period_timeout_sec must be greater than 0")
-        return period_timeout_sec
 
     def start_recording_if_not_started(self):
-        if not self.start_time:
-            self.start_time = time.time()
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
             self.time_from_last_timeout = self.start_time
 
-    @computed_field  # type: ignore[misc]
     @property
     def elapsed_time(self) -> float:
         if self.start_time is None:
             raise ValueError("TimeRecorder has not started recording time")
-        return time.time() - self.start_time
+        return time.perf_counter() - self.start_time
 
-    @computed_field  # type: ignore[misc]
     @property
     def elapsed_time_since_last_timeout(self) -> float:
+        return self._elapsed_time_since_last_timeout(time.perf_counter())
+
+    def _elapsed_time_since_last_timeout(self, now: float) -> float:
         if self.time_from_last_timeout is None:
-            self.time_from_last_timeout = time.time()
-        return time.time() - self.time_from_last_timeout
+            self.time_from_last_timeout = now
+        return now - self.time_from_last_timeout
 
-    @computed_field  # type: ignore[misc]
     @property
     def elapsed_time_str(self) -> str:
         return f"{timedelta(seconds=self.elapsed_time)}"
 
-    @computed_field  # type: ignore[misc]
     @property
     def has_period_passed(self) -> bool:
-        time_since_last_timeout = self.elapsed_time_since_last_timeout
+        # Read the clock only once, it is checked on every frame
+        now = time.perf_counter()
+        time_since_last_timeout = self._elapsed_time_since_last_timeout(now)
         if time_since_last_timeout >= self.period_timeout_sec:
             offset = time_since_last_timeout - self.period_timeout_sec
-            self.time_from_last_timeout = time.time() - offset
+            self.time_from_last_timeout = now - offset
             return True
         return False
 
-    @computed_field  # type: ignore[misc]
+    @property
+    def time_until_period_passes(self) -> float:
+        """
+        Seconds left until the current period passes, 0 if it already passed.
+        """
+        time_since_last_timeout = self._elapsed_time_since_last_timeout(time.perf_counter())
+        return max(0.0, self.period_timeout_sec - time_since_last_timeout)
+
     @property
     def elapsed_time_in_ms_since_last_asked(self) -> float:
         """
         This method returns the elapsed time in milliseconds since the last time
         the elapsed time was asked.
         """
-        new_time_asked = time.time()
+        new_time_asked = time.perf_counter()
         if self.time_from_last_asked is None:
             if self.start_time is None:
                 raise TimeRecorderError("TimeRecorder has not started recording time")
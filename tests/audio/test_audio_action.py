@@ -69,7 +69,6 @@ def test_calculate_period_timeout_sec(
     assert result_period_timeout == expected_period_timeout
 
 
-@pytest.mark.asyncio
 @pytest.mark.parametrize(
     "bpm,time_since_last_timeout_ms,action_period_timeout_sec,time_in_ms,expected_should_act",
     [
@@ -78,7 +77,7 @@ def test_calculate_period_timeout_sec(
         (120, 2 * 1000, 2, 1, True),
     ],
 )
-async def test_bpm_act(
+def test_bpm_act(
     bpm: float,
     time_since_last_timeout_ms: int,
     action_period_timeout_sec: float,
@@ -93,7 +92,7 @@ async def test_bpm_act(
     bpm_action.bpm = bpm
     bpm_action.time_since_last_timeout_ms = time_since_last_timeout_ms
     bpm_action.action_period_timeout_sec = action_period_timeout_sec
-    result_should_act, _ = await bpm_action.act(time_in_ms)
+    result_should_act, _ = bpm_action.act(time_in_ms)
     assert result_should_act is expected_should_act
 
 
@@ -107,7 +106,6 @@ def test_init_action_pitch_fail_less():
         audio_action.AudioActionPitch(min_pitch=ChromaIndex.e, max_pitch=ChromaIndex.d_sharp)
 
 
-@pytest.mark.asyncio
 @pytest.mark.parametrize(
     "min_pitch,max_pitch,chromas,total_time_in_ms,time_in_ms,expected_should_act",
     [
@@ -119,7 +117,7 @@ def test_init_action_pitch_fail_less():
         (ChromaIndex.f, ChromaIndex.f_sharp, [ChromaIndex.e, ChromaIndex.f], 20, 1, False),
     ],
 )
-async def test_pitch_act(
+def test_pitch_act(
     min_pitch: ChromaIndex,
     max_pitch: ChromaIndex,
     chromas: List[ChromaIndex],
@@ -128,17 +126,36 @@ async def test_pitch_act(
     expected_should_act: bool,
 ):
     action_pitch = audio_action.AudioActionPitch(min_pitch=min_pitch, max_pitch=max_pitch)
-    action_pitch.chromas = chromas
+    action_pitch.chromas = None if chromas is None else np.array(chromas, dtype=np.int8)
     action_pitch.total_time_in_ms = total_time_in_ms
-    result_should_act, _ = await action_pitch.act(time_in_ms)
+    result_should_act, _ = action_pitch.act(time_in_ms)
     assert result_should_act is expected_should_act
 
 
-@pytest.mark.asyncio
-async def test_error_pitch_act():
+def test_error_pitch_act():
     action_pitch = audio_action.AudioActionPitch(min_pitch=ChromaIndex.c, max_pitch=ChromaIndex.b)
-    action_pitch.chromas = [ChromaIndex.e]
+    action_pitch.chromas = np.array([ChromaIndex.e], dtype=np.int8)
     action_pitch.total_time_in_ms = 1000
     time_in_ms = 1
     with pytest.raises(audio_action.InvalidPitchSecondError):
-        await action_pitch.act(time_in_ms)
+        action_pitch.act(time_in_ms)
+
+
+def test_audio_actions_act_no_action():
+    action_pitch = audio_action.AudioActionPitch(min_pitch=ChromaIndex.a, max_pitch=ChromaIndex.b)
+    action_pitch.chromas = np.array([ChromaIndex.e], dtype=np.int8)
+    audio_actions = audio_action.AudioActions([action_pitch])
+
+    should_blend, blend_strength = audio_actions.act(1)
+    assert should_blend is False
+    assert blend_strength == 0.0
+
+
+def test_audio_actions_act_action():
+    action_pitch = audio_action.AudioActionPitch(min_pitch=ChromaIndex.c, max_pitch=ChromaIndex.b)
+    action_pitch.chromas = np.array([ChromaIndex.e], dtype=np.int8)
+    audio_actions = audio_action.AudioActions([action_pitch])
+
+    should_blend, blend_strength = audio_actions.act(1)
+    assert should_blend is True
+    assert blend_strength == 1.0
@@ -0,0 +1,23 @@
+from multiprocessing import Pipe
+from multiprocessing.reduction import ForkingPickler
+
+from nite.audio.audio_action import AudioActionBPM, AudioActions, BPMActionFrequency
+from nite.audio.audio_io import AudioListener
+from nite.audio.audio_processing import AudioProcessor, BPMDetector
+
+
+def test_audio_listener_start_can_be_pickled():
+    # The listener is sent to its own process, spawn pickles the target of the process
+    actions_receiver, actions_sender = Pipe(duplex=False)
+    audio_listener = AudioListener(
+        audio_processor=AudioProcessor(bpm_detector=BPMDetector()),
+        audio_actions=AudioActions(
+            [AudioActionBPM(bpm_action_frequency=BPMActionFrequency.kick, beats_per_compass=4)]
+        ),
+        actions_sender=actions_sender,
+    )
+
+    assert ForkingPickler.dumps(audio_listener.start)
+
+    actions_receiver.close()
+    actions_sender.close()
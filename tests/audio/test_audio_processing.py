@@ -94,6 +94,25 @@ def test_get_estimated_bpm(bpm_detecter: BPMDetector, has_enough_data: bool):
         assert estimated_bpm.shape == (1,)
 
 
+@pytest.mark.parametrize("bpm", [100, 128, 150])
+def test_get_estimated_bpm_downsampled(bpm: int):
+    # 20 seconds of clicks at the given BPM
+    click_times = np.arange(0, 20, 60 / bpm)
+    audio_sample = librosa.clicks(
+        times=click_times, sr=AUDIO_SAMPLING_RATE, length=20 * AUDIO_SAMPLING_RATE
+    )
+
+    estimated_bpms = []
+    for downsample_factor in [1, 4]:
+        buffer_audio = SampleBuffer()
+        buffer_audio.add_sample_to_buffer(audio_sample)
+        bpm_detecter = BPMDetector(buffer_audio=buffer_audio, downsample_factor=downsample_factor)
+        estimated_bpms.append(bpm_detecter._get_estimated_bpm())
+
+    assert estimated_bpms[1] == pytest.approx(estimated_bpms[0], abs=1)
+    assert estimated_bpms[0] == pytest.approx(bpm, abs=3)
+
+
 @pytest.mark.asyncio
 async def test_detect_bpm(bpm_detecter: BPMDetector):
     audio_sample = np.random.randn(AUDIO_SAMPLING_RATE)  # 1 second of random audio
@@ -103,6 +122,23 @@ async def test_detect_bpm(bpm_detecter: BPMDetector):
     assert isinstance(detected_bpm, float)
 
 
+@pytest.mark.asyncio
+async def test_detect_bpm_throttled():
+    bpm_detecter = BPMDetector(
+        buffer_audio=MockBuffer(has_enough_data=True),
+        buffer_recorded_bpms=MockBuffer(has_enough_data=True),
+        detection_period_sec=60,
+    )
+    bpm_detecter.buffer_recorded_bpms.add_sample_to_buffer(100)
+    audio_sample = np.random.randn(AUDIO_SAMPLING_RATE)  # 1 second of random audio
+
+    # The period hasn't passed, the BPM isn't estimated but the sample is buffered
+    detected_bpm = await bpm_detecter.detect(audio_sample)
+    assert detected_bpm == 100
+    assert len(bpm_detecter.buffer_audio.data) == 1
+    assert len(bpm_detecter.buffer_recorded_bpms.data) == 1
+
+
 # The expected BPMs were obtained using the librosa.beat.beat_track function
 # and making sure `beats` and `beats_cleaned` had the same value.
 # _, audio_sample_percussive = librosa.effects.hpss(y)
@@ -180,9 +216,24 @@ async def test_detect_pitch(pitch_detector: PitchDetector):
     detected_pitch = await pitch_detector.detect(audio_sample)
 
     assert detected_pitch is not None
-    assert isinstance(detected_pitch, list)
-    assert len(detected_pitch) == 1
-    assert isinstance(detected_pitch[0], ChromaIndex)
+    assert isinstance(detected_pitch, np.ndarray)
+    assert detected_pitch.dtype == np.int8
+    assert detected_pitch.shape == (1,)
+    assert ChromaIndex.c <= detected_pitch[0] <= ChromaIndex.b
+
+
+def test_get_chromas_per_second(pitch_detector: PitchDetector):
+    frames_per_second = AUDIO_SAMPLING_RATE / pitch_detector.hop_length
+    num_frames = int(2.5 * frames_per_second)
+    highest_prob_pitchs = np.full(num_frames, ChromaIndex.a, dtype=np.intp)
+    # A short run of a different pitch around the first second doesn't change its mode
+    highest_prob_pitchs[int(frames_per_second) : int(frames_per_second) + 5] = ChromaIndex.c
+    highest_prob_pitchs[int(1.5 * frames_per_second) :] = ChromaIndex.e
+
+    chromas_per_second = pitch_detector._get_chromas_per_second(highest_prob_pitchs)
+
+    assert chromas_per_second.dtype == np.int8
+    assert list(chromas_per_second) == [ChromaIndex.a, ChromaIndex.a]
 
 
 @pytest.mark.asyncio
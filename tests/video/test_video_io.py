@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nite.video.video import VideoMetadata
+from nite.video.video_io import VideoReader
+
+
+class MockVideoCapture:
+    def __init__(self, num_frames: int, fail_at_frame: int = -1):
+        self.num_frames = num_frames
+        self.fail_at_frame = fail_at_frame
+        self.i_frame = -1
+        self.released = False
+
+    def isOpened(self):  # noqa: N802, mirrors cv2.VideoCapture
+        return not self.released
+
+    def grab(self):
+        self.i_frame += 1
+        return self.i_frame < self.num_frames
+
+    def retrieve(self):
+        if self.i_frame == self.fail_at_frame:
+            raise RuntimeError("Could not decode frame")
+        return True, np.full((2, 2, 3), self.i_frame, dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+async def _read_all_frames(video_capture: MockVideoCapture):
+    metadata = VideoMetadata(name="test", num_frames=video_capture.num_frames, fps=30)
+    frames = VideoReader().from_video(Path("test.mp4"), metadata, video_capture=video_capture)
+    return [frame async for frame in frames]
+
+
+@pytest.mark.asyncio
+async def test_from_video():
+    video_capture = MockVideoCapture(num_frames=10)
+    frames = await _read_all_frames(video_capture)
+    assert [int(frame[0, 0, 0]) for frame in frames] == list(range(10))
+    assert video_capture.released
+
+
+@pytest.mark.asyncio
+async def test_from_video_decoding_error():
+    video_capture = MockVideoCapture(num_frames=100, fail_at_frame=3)
+    with pytest.raises(RuntimeError, match="Could not decode frame"):
+        await _read_all_frames(video_capture)
+    assert video_capture.released
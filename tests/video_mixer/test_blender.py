@@ -0,0 +1,96 @@
+import numpy as np
+
+from nite.video_mixer.blender import (
+    BlenderMath,
+    BlendModes,
+    blend_add,
+    blend_darken,
+    blend_diff,
+    blend_lighten,
+    blend_multiply,
+    blend_screen,
+    get_video_2_weighted,
+)
+
+
+def test_get_video_2_weighted_with_alpha():
+    video_2 = np.full((2, 2, 3), 200, dtype=np.uint8)
+    alpha = np.array([[0, 255], [128, 255]], dtype=np.uint8)
+
+    video_2_weighted = get_video_2_weighted(video_2, alpha, blend_strength=0.5)
+
+    assert video_2_weighted.dtype == np.uint8
+    assert video_2_weighted.shape == video_2.shape
+    # The alpha is applied to every color channel, without wrapping around
+    assert np.array_equal(video_2_weighted[0, 0], [0, 0, 0])
+    assert np.array_equal(video_2_weighted[0, 1], [100, 100, 100])
+    assert np.array_equal(video_2_weighted[1, 0], [50, 50, 50])
+
+
+def test_get_video_2_weighted_without_alpha():
+    video_2 = np.full((2, 2, 3), 200, dtype=np.uint8)
+
+    video_2_weighted = get_video_2_weighted(video_2, None, blend_strength=0.25)
+
+    assert video_2_weighted.dtype == np.uint8
+    assert np.array_equal(video_2_weighted, np.full((2, 2, 3), 50, dtype=np.uint8))
+
+
+def test_blend_add_saturates():
+    video_1 = np.full((2, 2, 3), 200, dtype=np.uint8)
+    video_2 = np.full((2, 2, 3), 100, dtype=np.uint8)
+
+    blended = blend_add(video_1, video_2, None, blend_strength=1.0)
+
+    assert np.array_equal(blended, np.full((2, 2, 3), 255, dtype=np.uint8))
+
+
+def test_blend_diff_is_absolute():
+    video_1 = np.full((2, 2, 3), 50, dtype=np.uint8)
+    video_2 = np.full((2, 2, 3), 100, dtype=np.uint8)
+
+    assert np.array_equal(blend_diff(video_1, video_2, None, 1.0), np.full((2, 2, 3), 50))
+    assert np.array_equal(blend_diff(video_2, video_1, None, 1.0), np.full((2, 2, 3), 50))
+
+
+def test_blend_multiply():
+    video_1 = np.full((2, 2, 3), 255, dtype=np.uint8)
+    video_2 = np.full((2, 2, 3), 100, dtype=np.uint8)
+
+    blended = blend_multiply(video_1, video_2, None, blend_strength=1.0)
+
+    assert np.array_equal(blended, np.full((2, 2, 3), 100, dtype=np.uint8))
+
+
+def test_blender_math_reuses_buffers():
+    blender = BlenderMath(BlendModes.add)
+    video_1 = np.full((2, 2, 3), 10, dtype=np.uint8)
+    video_2 = np.full((2, 2, 3), 20, dtype=np.uint8)
+
+    blended = blender.blend([video_1, video_2, None], blend_strength=1.0)
+    assert np.array_equal(blended, np.full((2, 2, 3), 30, dtype=np.uint8))
+    assert blender.blend([video_1, video_2, None], blend_strength=1.0) is blended
+
+    # New buffers are allocated if the frames change shape
+    video_1_bigger = np.full((4, 4, 3), 10, dtype=np.uint8)
+    video_2_bigger = np.full((4, 4, 3), 20, dtype=np.uint8)
+    blended_bigger = blender.blend([video_1_bigger, video_2_bigger, None], blend_strength=1.0)
+    assert blended_bigger.shape == (4, 4, 3)
+
+
+def test_blend_darken_and_lighten():
+    video_1 = np.array([[[10, 200, 30]]], dtype=np.uint8)
+    video_2 = np.array([[[20, 100, 30]]], dtype=np.uint8)
+
+    assert np.array_equal(blend_darken(video_1, video_2, None, 1.0), [[[10, 100, 30]]])
+    assert np.array_equal(blend_lighten(video_1, video_2, None, 1.0), [[[20, 200, 30]]])
+
+
+def test_blend_screen():
+    video_1 = np.array([[[0, 255, 128]]], dtype=np.uint8)
+    video_2 = np.array([[[100, 100, 128]]], dtype=np.uint8)
+
+    blended = blend_screen(video_1, video_2, None, blend_strength=1.0)
+
+    # 255 - (255 - a) * (255 - b) / 255
+    assert np.array_equal(blended, [[[100, 255, 192]]])
@@ -2,7 +2,7 @@ import numpy as np
 import pytest
 
 from nite.config import AUDIO_SAMPLING_RATE
-from nite.video_mixer.buffers import SampleBuffer, TimedSampleBuffer
+from nite.video_mixer.buffers import AudioBufferPool, SampleBuffer, TimedSampleBuffer
 
 
 class MockTimeRecorder:
@@ -31,6 +31,16 @@ def test_initial_state():
     assert timed_sample_buffer.num_samples_per_second[0] == 0
 
 
+def test_timed_sample_buffer_dtype():
+    timed_sample_buffer = TimedSampleBuffer(max_seconds_in_buffer=10, min_seconds_in_buffer=5)
+    timed_sample_buffer.timer_buffer = MockTimeRecorder(period_timeout_sec=1)
+
+    timed_sample_buffer.add_sample_to_buffer(np.ones(10, dtype=np.float64))
+
+    assert timed_sample_buffer.buffer.dtype == np.float32
+    assert timed_sample_buffer.buffered_data.dtype == np.float32
+
+
 def test_reset_buffer():
     timed_sample_buffer = TimedSampleBuffer(max_seconds_in_buffer=10, min_seconds_in_buffer=5)
     timed_sample_buffer.timer_buffer = MockTimeRecorder(period_timeout_sec=1)
@@ -259,3 +269,42 @@ def test_buffered_data(sample_buffer):
     sample_buffer.add_sample_to_buffer(sample)
 
     assert np.array_equal(sample_buffer.buffered_data, sample)
+
+
+def test_sample_buffer_wraps_around():
+    sample_buffer = SampleBuffer(max_buffer_size=5, num_samples_remove=2)
+    sample_buffer.add_sample_to_buffer(np.arange(4))
+    sample_buffer.add_sample_to_buffer(np.arange(4, 7))
+
+    assert np.array_equal(sample_buffer.buffered_data, np.arange(2, 7))
+
+    sample_buffer.remove_samples_from_buffer()
+    assert np.array_equal(sample_buffer.buffered_data, np.arange(4, 7))
+
+    sample_buffer.add_sample_to_buffer(np.arange(7, 15))
+    assert np.array_equal(sample_buffer.buffered_data, np.arange(10, 15))
+
+
+def test_audio_buffer_pool_reuses_buffers():
+    buffer_pool = AudioBufferPool(buffer_size=4, num_buffers=1)
+    buffer = buffer_pool.acquire(4)
+    assert buffer.shape == (4,)
+    assert buffer.dtype == np.float32
+
+    buffer_pool.release(buffer)
+    assert buffer_pool.acquire(4) is buffer
+
+
+def test_audio_buffer_pool_fallback():
+    buffer_pool = AudioBufferPool(buffer_size=4, num_buffers=1)
+    buffer = buffer_pool.acquire(4)
+    # The pool is empty, a new buffer is allocated
+    other_buffer = buffer_pool.acquire(4)
+    assert other_buffer is not buffer
+
+    # Buffers with other sizes are never pooled
+    buffer_odd_size = buffer_pool.acquire(3)
+    assert buffer_odd_size.shape == (3,)
+    buffer_pool.release(buffer_odd_size)
+    buffer_pool.release(buffer)
+    assert buffer_pool.acquire(4) is buffer